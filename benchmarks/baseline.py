@@ -0,0 +1,26 @@
+from textwrap import dedent
+import subprocess
+import ast
+
+
+def load_function(revision: str, file_path: str, class_name: str, func_name: str, module_globals: dict):
+    """
+    Classmethod `class_name.func_name` as it was in `file_path` at git `revision`,
+    executed with globals of current module, so it can be timed next to current code
+    """
+    source = subprocess.run(
+        ["git", "show", f"{revision}:{file_path}"],
+        capture_output=True, text=True, check=True,
+    ).stdout
+    class_node = next(
+        node for node in ast.parse(source).body
+        if isinstance(node, ast.ClassDef) and node.name == class_name
+    )
+    func_node = next(
+        node for node in class_node.body
+        if isinstance(node, ast.FunctionDef) and node.name == func_name
+    )
+
+    namespace = dict(module_globals)
+    exec(dedent(ast.get_source_segment(source, func_node, padded=True)), namespace)
+    return classmethod(namespace[func_name]).__get__(type(f"Baseline{class_name}", (), {}))
@@ -0,0 +1,69 @@
+"""
+Parse time and peak allocations of `Elsa.format_response` on chat answers of
+`corpus/chat`, compared with the parser before single-pass rewrite. Corpus answers
+are synthetic, in format of recorded /api/chat streams: tool call steps with
+quote results, streamed text answer and suggestions.
+
+    python benchmarks/format_response.py [--baseline <git revision>]
+"""
+from argparse import ArgumentParser
+from os import path, listdir
+from time import perf_counter
+import tracemalloc
+import sys
+
+sys.path.insert(0, path.dirname(path.dirname(path.abspath(__file__))))
+
+from benchmarks.baseline import load_function
+import modules.elsa as elsa
+
+CORPUS_PATH = path.join(path.dirname(path.abspath(__file__)), "corpus", "chat")
+LABEL = "show_swap_or_bridge_ui"
+BASELINE = "e01259d~1"      # parent of single-pass rewrite
+
+
+def without_random_fields(response: dict):
+    previous_message = {
+        key: value for key, value in response["previous_message"].items()
+        if key not in ("createdAt", "revisionId")
+    }
+    return {**response, "previous_message": previous_message}
+
+
+def measure(func, text: str, repeat: int = 5, number: int = 300):
+    best = min(
+        timeit_once(func, text, number) for _ in range(repeat)
+    )
+    tracemalloc.start()
+    func(text, LABEL)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return best, peak
+
+
+def timeit_once(func, text: str, number: int):
+    started_at = perf_counter()
+    for _ in range(number):
+        func(text, LABEL)
+    return (perf_counter() - started_at) / number
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--baseline", default=BASELINE, help="git revision of parser to compare with")
+    args = parser.parse_args()
+
+    baseline = load_function(args.baseline, "modules/elsa.py", "Elsa", "format_response", vars(elsa))
+    for file_name in sorted(listdir(CORPUS_PATH), key=lambda name: path.getsize(path.join(CORPUS_PATH, name))):
+        with open(path.join(CORPUS_PATH, file_name), encoding="utf-8") as f:
+            text = f.read()
+
+        if without_random_fields(baseline(text, LABEL)) != without_random_fields(elsa.Elsa.format_response(text, LABEL)):
+            raise AssertionError(f'{file_name}: output differs from baseline')
+
+        old_time, old_peak = measure(baseline, text)
+        new_time, new_peak = measure(elsa.Elsa.format_response, text)
+        print(
+            f'{file_name:12} {len(text) / 1024:5.1f}KB | '
+            f'{old_time * 1e6:6.0f}us {old_peak / 1024:6.1f}KiB -> {new_time * 1e6:6.0f}us {new_peak / 1024:6.1f}KiB'
+        )
@@ -0,0 +1,56 @@
+"""
+Decoding of 10k `balanceOf` results by `MultiCall.decode_resp`, compared with
+decoder before precompiled functions.
+
+    python benchmarks/multicall_decode.py [--baseline <git revision>]
+"""
+from argparse import ArgumentParser
+from time import perf_counter
+from os import path
+import sys
+
+sys.path.insert(0, path.dirname(path.dirname(path.abspath(__file__))))
+
+from benchmarks.baseline import load_function
+import modules.multicall as multicall
+import modules.config as config
+
+RESULTS = 10_000
+BASELINE = "83a0e5a~1"      # parent of precompiled MultiCall functions
+
+
+class Contract:
+    """Just address and abi, which are read by decoder"""
+
+    def __init__(self, address: str, abi: list):
+        self.address = address
+        self.abi = abi
+
+
+def measure(decode, token_data: dict, responses: list, repeat: int = 5):
+    times = []
+    for _ in range(repeat):
+        started_at = perf_counter()
+        results = [decode(token_data, resp)[0] for resp in responses]
+        times.append(perf_counter() - started_at)
+    return min(times), results
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--baseline", default=BASELINE, help="git revision of decoder to compare with")
+    args = parser.parse_args()
+
+    baseline = load_function(args.baseline, "modules/multicall.py", "MultiCall", "decode_resp", vars(multicall))
+    token_data = {
+        "contract": Contract(config.TOKEN_ADDRESSES["base"]["USDC"], config.ERC20_ABI),
+        "func": "balanceOf",
+        "args": [],
+    }
+    responses = [(index * 10 ** 12).to_bytes(32, "big") for index in range(RESULTS)]
+
+    old_time, old_results = measure(baseline, token_data, responses)
+    new_time, new_results = measure(multicall.MultiCall.decode_resp, token_data, responses)
+    if old_results != new_results:
+        raise AssertionError('Decoded results differ from baseline')
+    print(f'{RESULTS} balanceOf results | {old_time * 1000:.1f}ms -> {new_time * 1000:.1f}ms')
@@ -22,7 +22,7 @@ async def run_modules(
             proxy=module_data["proxy"],
         )
         wallet = Wallet(
-            privatekey=module_data["privatekey"],
+            privatekey=db.get_privatekey(encoded_pk=module_data["encoded_privatekey"]),
             encoded_pk=module_data["encoded_privatekey"],
             db=db,
             proxy=module_data["proxy"],
@@ -53,38 +53,42 @@ async def run_modules(
             await asyncio.sleep(randint(*SLEEP_AFTER_ACCOUNT))
 
 
-async def thread_runner(mode: int, active_wallets: list, lock: asyncio.Lock):
+async def thread_runner(mode: int):
     while True:
-        async with lock:
-            module_data = db.get_random_module(active_wallets=active_wallets)
-
-            if module_data == 'No more accounts left':
-                return
-            else:
-                active_wallets.append(module_data["address"])
+        module_data = db.claim_module()
+        if module_data == 'No more accounts left':
+            return
 
         await run_modules(
             mode=mode,
             module_data=module_data,
         )
-        async with lock:
-            active_wallets.remove(module_data["address"])
+        db.release_module(module_data)
 
 
 async def runner(mode: int):
     RPCInitializer(proxies=db.proxies)
-    lock = asyncio.Lock()
-    active_wallets = []
 
     await asyncio.gather(*[
-        thread_runner(mode=mode, active_wallets=active_wallets, lock=lock)
+        thread_runner(mode=mode)
         for _ in range(THREADS)
     ])
 
+    await RPCInitializer.close()
+    logger.debug(f'[•] Database | Writer stats: {db.writer.get_metrics()}')
+    approve_stats = AllowanceLedger.get_stats()
+    if approve_stats["approves_skipped"]:
+        logger.info(f'[•] Approve | Skipped {approve_stats["approves_skipped"]} approves of {approve_stats["approves_sent"] + approve_stats["approves_skipped"]}, saved ~{approve_stats["saved_seconds"]}s')
     logger.success(f'All accounts done.')
     return 'Ended'
 
 
+async def portfolio_runner():
+    RPCInitializer(proxies=db.proxies)
+    await Portfolio(db).snapshot()
+    await RPCInitializer.close()
+
+
 if __name__ == '__main__':
     if os.name == "nt":
         asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
@@ -103,6 +107,10 @@ if __name__ == '__main__':
                     if asyncio.run(runner(mode=mode.soft_id)) == "Ended": break
                     print('')
 
+                case "portfolio":
+                    asyncio.run(portfolio_runner())
+                    print('')
+
 
         sleep(0.1)
         input('\n > Exit\n')
@@ -7,3 +7,5 @@ from .wallet import Wallet
 # modules
 from .elsa import Elsa
 from .rpc_initializer import RPCInitializer
+from .portfolio import Portfolio
+from .allowance_ledger import AllowanceLedger
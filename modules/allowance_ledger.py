@@ -0,0 +1,135 @@
+from loguru import logger
+from os import path, replace
+import asyncio
+import json
+
+from modules.token_registry import TokenRegistry
+from modules.multicall import MultiCall
+
+
+class AllowanceLedger:
+    """
+    Known allowances per (chain, owner, token, spender). Allowances requested by
+    different wallets within `BATCH_WINDOW` are read from chain in one MultiCall.
+    Confirmed approvals update the ledger, so covered approvals are not sent again.
+    Approve tx hashes are saved on disk, so pipeline gets hash of existing approval in next runs too.
+    """
+
+    CACHE_PATH: str = 'databases/approves.json'
+    BATCH_WINDOW: float = 0.05          # seconds to collect allowance requests of all wallets
+    INFINITE: int = 2 ** 255            # allowances above are not decreased by spending
+
+    allowances: dict = {}               # (chain_name, owner, token_address, spender): {"value": int, "tx_hash": str | None}
+    approve_txs: dict | None = None     # "chain_name:owner:token_address:spender": tx_hash of last confirmed approve
+    pending: dict = {}                  # chain_name: {key: asyncio.Future} of next MultiCall
+    stats: dict = {"sent": 0, "skipped": 0, "approve_seconds": 0.0}
+
+    @classmethod
+    async def get_allowance(cls, chain_name: str, owner: str, token_name: str, spender: str):
+        key = (chain_name, owner, TokenRegistry.get_address(chain_name, token_name), spender)
+        if key in cls.allowances:
+            return cls.allowances[key]["value"]
+
+        chain_pending = cls.pending.setdefault(chain_name, {})
+        if key not in chain_pending:
+            if not chain_pending:
+                asyncio.get_running_loop().call_later(cls.BATCH_WINDOW, cls._flush, chain_name)
+            chain_pending[key] = asyncio.get_running_loop().create_future()
+        return await asyncio.shield(chain_pending[key])
+
+
+    @classmethod
+    def _flush(cls, chain_name: str):
+        chain_pending = cls.pending.pop(chain_name, {})
+        if chain_pending:
+            asyncio.ensure_future(cls._read_allowances(chain_name, chain_pending))
+
+
+    @classmethod
+    async def _read_allowances(cls, chain_name: str, chain_pending: dict):
+        try:
+            allowances = await MultiCall.call(
+                chain_name=chain_name,
+                call_data={
+                    key: {
+                        "contract": TokenRegistry.get_contract(chain_name, key[2]),
+                        "func": "allowance",
+                        "args": [key[1], key[3]],
+                    }
+                    for key in chain_pending
+                }
+            )
+        except Exception as err:
+            for future in chain_pending.values():
+                if not future.done(): future.set_exception(err)
+            return
+
+        for key, future in chain_pending.items():
+            cls.allowances.setdefault(key, {"value": allowances[key], "tx_hash": None})
+            if not future.done(): future.set_result(cls.allowances[key]["value"])
+
+
+    @classmethod
+    def _load(cls):
+        if cls.approve_txs is not None: return
+        cls.approve_txs = {}
+        if path.isfile(cls.CACHE_PATH):
+            try:
+                with open(cls.CACHE_PATH, encoding="utf-8") as f:
+                    cls.approve_txs = json.load(f)
+            except Exception as err:
+                logger.warning(f'[•] Approve | Failed to read {cls.CACHE_PATH}, approve txs will be sent again: {err}')
+
+
+    @classmethod
+    def _save(cls):
+        with open(cls.CACHE_PATH + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(cls.approve_txs, f, indent=4)
+        replace(cls.CACHE_PATH + ".tmp", cls.CACHE_PATH)
+
+
+    @classmethod
+    def get_approve_tx(cls, chain_name: str, owner: str, token_name: str, spender: str):
+        """Hash of confirmed approve of spender, None if wallet never approved it in this or previous runs"""
+        key = (chain_name, owner, TokenRegistry.get_address(chain_name, token_name), spender)
+        if tx_hash := cls.allowances.get(key, {}).get("tx_hash"):
+            return tx_hash
+        cls._load()
+        return cls.approve_txs.get(":".join(key))
+
+
+    @classmethod
+    def on_approved(cls, chain_name: str, owner: str, token_name: str, spender: str, value: int, tx_hash: str, seconds: float):
+        key = (chain_name, owner, TokenRegistry.get_address(chain_name, token_name), spender)
+        cls.allowances[key] = {"value": value, "tx_hash": tx_hash}
+        cls._load()
+        cls.approve_txs[":".join(key)] = tx_hash
+        cls._save()
+        cls.stats["sent"] += 1
+        cls.stats["approve_seconds"] += seconds
+
+
+    @classmethod
+    def on_skipped(cls, chain_name: str, owner: str, token_name: str):
+        cls.stats["skipped"] += 1
+        logger.debug(f'[•] {owner} | {token_name} allowance in {chain_name.title()} is enough, approve skipped')
+
+
+    @classmethod
+    def invalidate(cls, chain_name: str, owner: str):
+        """Drop finite allowances of owner after tokens were spent, they are read from chain again on next check"""
+        for key in [
+            key for key, allowance in cls.allowances.items()
+            if key[0] == chain_name and key[1] == owner and allowance["value"] < cls.INFINITE
+        ]:
+            del cls.allowances[key]
+
+
+    @classmethod
+    def get_stats(cls):
+        average_approve = cls.stats["approve_seconds"] / cls.stats["sent"] if cls.stats["sent"] else 0
+        return {
+            "approves_sent": cls.stats["sent"],
+            "approves_skipped": cls.stats["skipped"],
+            "saved_seconds": round(average_approve * cls.stats["skipped"], 1),
+        }
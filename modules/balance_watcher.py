@@ -0,0 +1,70 @@
+from typing import Callable
+from loguru import logger
+import asyncio
+
+from modules.rpc_initializer import RPCInitializer
+from modules.chain_service import ChainService
+from modules.multicall import MultiCall
+import modules.config as config
+
+
+class BalanceWatcher(ChainService):
+    """
+    One watcher task per chain reads ETH balances of every waiting wallet with one
+    MultiCall per block time and wakes waiters whose condition is met. Rpc load
+    doesn't depend on how many wallets are waiting.
+    """
+
+    @classmethod
+    def _create_state(cls, chain_name: str):
+        return {
+            "interval": config.get_block_time(chain_name),
+            "waiters": [],              # [{"address": str, "check": callable, "future": asyncio.Future}]
+            "watcher": None,
+        }
+
+
+    @classmethod
+    async def wait(cls, chain_name: str, address: str, check: Callable[[int], bool]):
+        """Returns ETH balance in wei as soon as `check(balance)` is true"""
+        state = cls._get_state(chain_name)
+        waiter = {"address": address, "check": check, "future": state["loop"].create_future()}
+        state["waiters"].append(waiter)
+
+        if state["watcher"] is None or state["watcher"].done():
+            state["watcher"] = asyncio.ensure_future(cls._watch(chain_name, state))
+
+        try:
+            return await waiter["future"]
+        finally:
+            if waiter in state["waiters"]:
+                state["waiters"].remove(waiter)
+
+
+    @classmethod
+    async def _watch(cls, chain_name: str, state: dict):
+        multicall_contract = RPCInitializer.initialize_contract(
+            chain_name=chain_name,
+            address=MultiCall.multicall_address,
+            abi=MultiCall.multicall_abi,
+        )
+        while state["waiters"]:
+            await asyncio.sleep(state["interval"])
+            addresses = {waiter["address"] for waiter in state["waiters"]}
+            try:
+                balances = await MultiCall.call(
+                    chain_name=chain_name,
+                    call_data={
+                        address: {"contract": multicall_contract, "func": "getEthBalance", "args": [address]}
+                        for address in addresses
+                    }
+                )
+            except Exception as err:
+                logger.warning(f'[•] Web3 | {chain_name.title()} balance watcher error: {err}')
+                continue
+
+            for waiter in state["waiters"]:
+                balance = balances.get(waiter["address"])
+                if balance is not None and not waiter["future"].done() and waiter["check"](balance):
+                    waiter["future"].set_result(balance)
+            state["waiters"][:] = [waiter for waiter in state["waiters"] if not waiter["future"].done()]
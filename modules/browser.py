@@ -2,7 +2,9 @@ from curl_cffi.requests import AsyncSession
 from random import choice
 from loguru import logger
 from uuid import uuid4
+import asyncio
 
+from modules.chat_stream import ChatStream
 from modules.utils import get_current_date
 from modules.retry import have_json
 from modules.database import DataBase
@@ -35,6 +37,7 @@ class Browser:
         self.session = self.get_new_session()
         self.chats_memory = {}
         self.signature_body = {}
+        self.draining = set()       # chat streams read till the end in background
 
 
     def get_new_session(self):
@@ -130,7 +133,8 @@ class Browser:
         }
 
 
-    async def ask_ai(self, question: str, chat_id: str = None, previous_message: dict = None):
+    async def ask_ai(self, question: str, chat_id: str = None, previous_message: dict = None, wait_tool: str = None):
+        """wait_tool: stream answer and return as soon as result of this tool is received"""
         if chat_id is None:
             chat_id = str(uuid4())
             messages = [{
@@ -166,14 +170,46 @@ class Browser:
         if len(messages) == 2:
             payload["locale"] = "en"
 
-        r = await self.session.post(
-            url="https://app.heyelsa.ai/api/chat",
-            json=payload,
-            headers={
+        request_params = {
+            "url": "https://app.heyelsa.ai/api/chat",
+            "json": payload,
+            "headers": {
                 "Referer": f"https://app.heyelsa.ai/chat/{chat_id}",
             }
-        )
-        return r.text, chat_id
+        }
+        if wait_tool is None:
+            r = await self.session.post(**request_params)
+            return r.text, chat_id
+
+        chat_stream = ChatStream(tool_name=wait_tool)
+        r = await self.session.request(method="POST", stream=True, **request_params)
+        lines = r.aiter_lines()
+        try:
+            async for line in lines:
+                if chat_stream.feed(line.decode().rstrip("\r")):
+                    break
+            else:
+                await r.aclose()
+                return chat_stream.text, chat_id
+        except BaseException:
+            await r.aclose()
+            raise
+
+        # rest of answer is still read, so chat is completed on server like in browser
+        task = asyncio.ensure_future(self._drain_stream(r, lines))
+        self.draining.add(task)
+        task.add_done_callback(self.draining.discard)
+        return chat_stream.text, chat_id
+
+
+    async def _drain_stream(self, response, lines):
+        try:
+            async for _ in lines:
+                pass
+        except Exception as err:
+            logger.debug(f'[•] {self.address} | Failed to read rest of chat answer: {err}')
+        finally:
+            await response.aclose()
 
 
     async def pipeline(
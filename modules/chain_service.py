@@ -0,0 +1,28 @@
+import asyncio
+
+
+class ChainService:
+    """
+    Base of process-wide services with state per chain. State is created again when
+    event loop changes, as futures and tasks of old loop can't be awaited in new one.
+    """
+
+    chains: dict = {}                   # chain_name: state, see `_create_state` of subclass
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls.chains = {}
+
+
+    @classmethod
+    def _get_state(cls, chain_name: str):
+        loop = asyncio.get_running_loop()
+        state = cls.chains.get(chain_name)
+        if state is None or state["loop"] is not loop:
+            state = cls.chains[chain_name] = {"loop": loop, **cls._create_state(chain_name)}
+        return state
+
+
+    @classmethod
+    def _create_state(cls, chain_name: str) -> dict:
+        raise NotImplementedError
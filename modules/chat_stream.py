@@ -0,0 +1,34 @@
+from json import loads
+
+
+class ChatStream:
+    """
+    Incremental reader of /api/chat data stream lines (`f:` message start, `0:` text,
+    `9:` tool call, `a:` tool result). Tells when result of wanted tool is received,
+    so caller doesn't have to wait for the rest of the answer.
+    """
+
+    def __init__(self, tool_name: str):
+        self.tool_name = tool_name
+        self.lines = []
+        self.tool_call_ids = set()      # calls of wanted tool, waiting for result
+        self.done = False
+
+
+    def feed(self, line: str):
+        """Returns True when result of wanted tool is received"""
+        self.lines.append(line)
+        if line.startswith("9:") or line.startswith("a:"):
+            part_text = line[2:]
+            if part_text.startswith("{") and part_text.endswith("}"):
+                part = loads(part_text)
+                if part.get("toolName") == self.tool_name:
+                    self.tool_call_ids.add(part.get("toolCallId"))
+                if part.get("toolCallId") in self.tool_call_ids and "result" in part:
+                    self.done = True
+        return self.done
+
+
+    @property
+    def text(self):
+        return "\n".join(self.lines)
@@ -1,13 +1,13 @@
 
 CHAINS_DATA = {
-    'ethereum': {'explorer': 'https://etherscan.io/tx/'},
-    'base': {'explorer': 'https://basescan.org/tx/'},
-    'arbitrum': {'explorer': 'https://arbiscan.io/tx/'},
+    'ethereum': {'explorer': 'https://etherscan.io/tx/', 'block_time': 12},
+    'base': {'explorer': 'https://basescan.org/tx/', 'block_time': 2},
+    'arbitrum': {'explorer': 'https://arbiscan.io/tx/', 'block_time': 0.25},
     'zksync': {'explorer': 'https://era.zksync.network/tx/'},
-    'optimism': {'explorer': 'https://optimistic.etherscan.io/tx/'},
+    'optimism': {'explorer': 'https://optimistic.etherscan.io/tx/', 'block_time': 2},
     'scroll': {'explorer': 'https://scrollscan.com/tx/'},
     'nova': {'explorer': 'https://nova-explorer.arbitrum.io/tx/'},
-    'linea': {'explorer': 'https://lineascan.build/tx/'},
+    'linea': {'explorer': 'https://lineascan.build/tx/', 'block_time': 2},
     'bsc': {'explorer': 'https://bscscan.com/tx/'},
     'polygon': {'explorer': 'https://polygonscan.com/tx/'},
     'celo': {'explorer': 'https://celoscan.io/tx/'},
@@ -27,6 +27,14 @@ CHAINS_DATA = {
     "camp": {'explorer': 'https://basecamp.cloud.blockscout.com/tx/'},
 }
 
+MIN_BLOCK_TIME = 1          # seconds, for chains with sub-second blocks
+DEFAULT_BLOCK_TIME = 2
+
+
+def get_block_time(chain_name: str):
+    """Seconds between blocks, not less than `MIN_BLOCK_TIME`. Polling interval of shared chain services"""
+    return max(MIN_BLOCK_TIME, CHAINS_DATA.get(chain_name, {}).get("block_time", DEFAULT_BLOCK_TIME))
+
 CHAIN_TOKENS = {
     "base": "ETH",
     "blast": "ETH",
@@ -68,3 +76,11 @@ TOKEN_ADDRESSES = {
         "AAVE": "0x63706e401c06ac8513145b7687A14804d17f814b",
     }
 }
+
+ERC20_ABI = [
+    {"inputs": [{"internalType": "address", "name": "account", "type": "address"}], "name": "balanceOf", "outputs": [{"internalType": "uint256", "name": "", "type": "uint256"}], "stateMutability": "view", "type": "function"},
+    {"inputs": [], "name": "decimals", "outputs": [{"internalType": "uint8", "name": "", "type": "uint8"}], "stateMutability": "view", "type": "function"},
+    {"inputs": [], "name": "symbol", "outputs": [{"internalType": "string", "name": "", "type": "string"}], "stateMutability": "view", "type": "function"},
+    {"inputs": [{"internalType": "address", "name": "owner", "type": "address"}, {"internalType": "address", "name": "spender", "type": "address"}], "name": "allowance", "outputs": [{"internalType": "uint256", "name": "", "type": "uint256"}], "stateMutability": "view", "type": "function"},
+    {"inputs": [{"internalType": "address", "name": "spender", "type": "address"}, {"internalType": "uint256", "name": "value", "type": "uint256"}], "name": "approve", "outputs": [{"internalType": "bool", "name": "", "type": "bool"}], "stateMutability": "nonpayable", "type": "function"},
+]
@@ -1,42 +1,86 @@
-from random import choice, randint, shuffle, random
+from concurrent.futures import ProcessPoolExecutor
+from random import randint, shuffle, random
+from collections import OrderedDict, deque
 from cryptography.fernet import Fernet
+from os import path, mkdir, cpu_count
 from base64 import urlsafe_b64encode
+from itertools import cycle, repeat
+from datetime import datetime
 from time import sleep, time
-from os import path, mkdir
 from loguru import logger
 from hashlib import md5
+from tqdm import tqdm
 import asyncio
-import json
 
 from .retry import DataBaseError
+from .storage import JsonStorage, SqliteStorage, ModulesIndex, RefCodesPool, StorageWriter, migrate_json_to_sqlite
 from modules.utils import get_address, WindowName, sleeping
-from settings import SHUFFLE_WALLETS, SWAP_SETTINGS, BRIDGE_SETTINGS, USE_REF_CHANCE
+from settings import SHUFFLE_WALLETS, SWAP_SETTINGS, BRIDGE_SETTINGS, USE_REF_CHANCE, DATABASE_ENGINE, THREADS
 
 from cryptography.fernet import InvalidToken
 
 
+def encode_wallets_chunk(key: bytes, chunk: list):
+    """Process pool worker: [(privatekey, proxy)] -> [(encoded_pk, address, proxy)]"""
+    personal_key = Fernet(key)
+    return [
+        (personal_key.encrypt(privatekey.encode()).decode(), get_address(privatekey), proxy)
+        for privatekey, proxy in chunk
+    ]
+
+
 class DataBase:
+    IMPORT_CHUNK_SIZE: int = 1000   # privatekeys per process pool task and per storage write
+
     def __init__(self):
+        started_at = time()
 
         self.modules_db_name = 'databases/modules.json'
         self.report_db_name = 'databases/report.json'
         self.refs_db_name = 'databases/refcodes.json'
+        self.sqlite_db_name = 'databases/database.sqlite3'
         self.personal_key = None
+        self.personal_key_raw = None  # key bytes for import workers
         self.window_name = None
 
-        self.changes_lock = asyncio.Lock()
+        self.privatekeys_cache = OrderedDict()  # encoded_pk: decoded privatekey of recently picked wallets
+        self.privatekeys_cache_size = max(THREADS * 2, 16)
 
         # create db's if not exists
         if not path.isdir(self.modules_db_name.split('/')[0]):
             mkdir(self.modules_db_name.split('/')[0])
 
-        for db_params in [
-            {"name": self.modules_db_name, "value": "[]"},
-            {"name": self.report_db_name, "value": "{}"},
-            {"name": self.refs_db_name, "value": "[]"},
-        ]:
-            if not path.isfile(db_params["name"]):
-                with open(db_params["name"], 'w') as f: f.write(db_params["value"])
+        if DATABASE_ENGINE == "sqlite":
+            self.storage = SqliteStorage(db_path=self.sqlite_db_name)
+            migrate_json_to_sqlite(
+                storage=self.storage,
+                modules_path=self.modules_db_name,
+                report_path=self.report_db_name,
+                refs_path=self.refs_db_name,
+            )
+        elif DATABASE_ENGINE == "json":
+            self.storage = JsonStorage(
+                modules_path=self.modules_db_name,
+                report_path=self.report_db_name,
+                refs_path=self.refs_db_name,
+            )
+        else:
+            raise DataBaseError(f'Unexpected DATABASE_ENGINE "{DATABASE_ENGINE}", must be "json" or "sqlite"')
+
+        self.modules = ModulesIndex(
+            max_token_hold=SWAP_SETTINGS["max_token_hold"],
+            max_chains_hold=BRIDGE_SETTINGS["max_chains_hold"],
+        )
+        wallets, ops = self.storage.load_modules()
+        self.modules.load(wallets=wallets, ops=ops, reset_failed=True)
+        self.journal_ops = len(ops)  # operations written after last modules snapshot
+
+        self.refs = RefCodesPool()
+        refs, ops = self.storage.load_refs()
+        self.refs.load(refs=refs, ops=ops)
+
+        # from now storage is used only from writer thread
+        self.writer = StorageWriter(storage=self.storage)
 
         with open('input_data/proxies.txt') as f:
             self.proxies = [
@@ -46,7 +90,10 @@ class DataBase:
             ]
 
         amounts = self.get_amounts()
-        logger.info(f'Loaded {amounts["modules_amount"]} modules for {amounts["accs_amount"]} accounts\n')
+        logger.info(
+            f'Loaded {amounts["modules_amount"]} modules for {amounts["accs_amount"]} accounts '
+            f'in {round(time() - started_at, 2)}s\n'
+        )
 
 
     def set_password(self):
@@ -63,20 +110,20 @@ class DataBase:
         sleep(0.2)
 
         password = md5(raw_password.encode()).hexdigest().encode()
-        self.personal_key = Fernet(urlsafe_b64encode(password))
+        self.personal_key_raw = urlsafe_b64encode(password)
+        self.personal_key = Fernet(self.personal_key_raw)
 
 
     def get_password(self):
         if self.personal_key is not None: return
 
-        with open(self.modules_db_name, encoding="utf-8") as f: modules_db = json.load(f)
-        if not modules_db: return
-
-        first_pk = list(modules_db.keys())[0]
+        first_pk = next(iter(self.modules.wallets), None)
         if not first_pk: return
         try:
-            temp_key = Fernet(urlsafe_b64encode(md5("@karamelniy dumb shit encrypting".encode()).hexdigest().encode()))
+            temp_key_raw = urlsafe_b64encode(md5("@karamelniy dumb shit encrypting".encode()).hexdigest().encode())
+            temp_key = Fernet(temp_key_raw)
             self.decode_pk(pk=first_pk, key=temp_key)
+            self.personal_key_raw = temp_key_raw
             self.personal_key = temp_key
             return
         except InvalidToken: pass
@@ -89,6 +136,7 @@ class DataBase:
 
                 temp_key = Fernet(urlsafe_b64encode(password))
                 self.decode_pk(pk=first_pk, key=temp_key)
+                self.personal_key_raw = urlsafe_b64encode(password)
                 self.personal_key = temp_key
                 logger.success(f'[+] Soft | Access granted!\n')
                 return
@@ -109,7 +157,58 @@ class DataBase:
         return key.decrypt(pk).decode()
 
 
+    def get_privatekey(self, encoded_pk: str):
+        if encoded_pk in self.privatekeys_cache:
+            self.privatekeys_cache.move_to_end(encoded_pk)
+            return self.privatekeys_cache[encoded_pk]
+
+        privatekey = self.decode_pk(pk=encoded_pk)
+        self.privatekeys_cache[encoded_pk] = privatekey
+        if len(self.privatekeys_cache) > self.privatekeys_cache_size:
+            self.privatekeys_cache.popitem(last=False)
+        return privatekey
+
+
+    def forget_privatekey(self, encoded_pk: str):
+        self.privatekeys_cache.pop(encoded_pk, None)
+
+
     def create_modules(self, mode: int):
+        self.set_password()
+
+        with open('input_data/proxies.txt') as f:
+            proxies = f.read().splitlines()
+        if len(proxies) == 0 or proxies == [""] or proxies == ["http://login:password@ip:port"]:
+            logger.error('You will not use proxy')
+            proxies = []
+
+        self.modules.load(wallets={})
+        # keys are encoded and index is filled in this thread, writer only writes ready chunks
+        wallets_chunks = list(self._import_wallets(proxies=proxies))
+        self.writer.call_sync(self.storage.write_modules, wallets_chunks)
+        self.journal_ops = 0
+        amounts = self.get_amounts()
+        logger.info(f'Created Database for {amounts["accs_amount"]} accounts with {amounts["modules_amount"]} modules!\n')
+
+
+    def _iter_privatekeys_chunks(self, proxies: list):
+        proxies_cycle = cycle(proxies) if proxies else repeat(None)
+        chunk = []
+        with open('input_data/privatekeys.txt') as f:
+            for line in f:
+                privatekey = line.strip()
+                if not privatekey: continue
+
+                chunk.append((privatekey, next(proxies_cycle)))
+                if len(chunk) == self.IMPORT_CHUNK_SIZE:
+                    yield chunk
+                    chunk = []
+        if chunk:
+            yield chunk
+
+
+    def _import_wallets(self, proxies: list):
+        """Yields chunks of new wallets, addresses and encrypted keys are made in process pool"""
         def create_raw_modules():
             swap_modules = [
                 {"module_name": "swap", "status": "to_run", "advance_info": {}}
@@ -121,265 +220,187 @@ class DataBase:
             ]
             return swap_modules + bridge_modules
 
-        self.set_password()
+        def add_wallets(encoded_chunk: list):
+            new_modules = {
+                encoded_pk: {
+                    "address": address,
+                    "modules": create_raw_modules(),
+                    "proxy": proxy,
+                }
+                for encoded_pk, address, proxy in encoded_chunk
+            }
+            self.modules.add_wallets(new_modules)
+            progress_bar.update(len(new_modules))
+            return new_modules
 
         with open('input_data/privatekeys.txt') as f:
-            privatekeys = f.read().splitlines()
-
-        with open('input_data/proxies.txt') as f:
-            proxies = f.read().splitlines()
-        if len(proxies) == 0 or proxies == [""] or proxies == ["http://login:password@ip:port"]:
-            logger.error('You will not use proxy')
-            proxies = [None for _ in range(len(privatekeys))]
-        else:
-            proxies = list(proxies * (len(privatekeys) // len(proxies) + 1))[:len(privatekeys)]
+            privatekeys_amount = sum(1 for line in f if line.strip())
+        progress_bar = tqdm(
+            total=privatekeys_amount,
+            desc=datetime.now().strftime('%H:%M:%S'),
+            bar_format='{desc} | [•] Importing wallets {n_fmt}/{total_fmt} [{elapsed}]'
+        )
+
+        with progress_bar:
+            chunks = self._iter_privatekeys_chunks(proxies=proxies)
+            if privatekeys_amount <= self.IMPORT_CHUNK_SIZE:
+                for chunk in chunks:
+                    yield add_wallets(encode_wallets_chunk(key=self.personal_key_raw, chunk=chunk))
+                return
 
-        with open(self.report_db_name, 'w') as f: f.write('{}')  # clear report db
+            workers = cpu_count() or 1
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                pending = deque()
+                for chunk in chunks:
+                    pending.append(executor.submit(encode_wallets_chunk, self.personal_key_raw, chunk))
+                    if len(pending) >= workers * 2:
+                        yield add_wallets(pending.popleft().result())
+                while pending:
+                    yield add_wallets(pending.popleft().result())
 
-        new_modules = {
-            self.encode_pk(pk): {
-                "address": get_address(pk),
-                "modules": create_raw_modules(),
-                "proxy": proxy,
-            }
-            for pk, proxy in zip(privatekeys, proxies)
-        }
 
-        with open(self.modules_db_name, 'w', encoding="utf-8") as f: json.dump(new_modules, f)
-        amounts = self.get_amounts()
-        logger.info(f'Created Database for {amounts["accs_amount"]} accounts with {amounts["modules_amount"]} modules!\n')
+    def get_wallet_addresses(self):
+        """Returns {encoded_pk: address} of all wallets"""
+        return {encoded_pk: wallet_data["address"] for encoded_pk, wallet_data in self.modules.wallets.items()}
 
 
     def get_amounts(self):
-        with open(self.modules_db_name, encoding="utf-8") as f: modules_db = json.load(f)
-        modules_len = sum([len(modules_db[acc]["modules"]) for acc in modules_db])
+        accs_amount, modules_len = self.modules.get_amounts()
 
-        for acc in modules_db:
-            for index, module in enumerate(modules_db[acc]["modules"]):
-                if module["status"] in ["failed", "cloudflare"]: modules_db[acc]["modules"][index]["status"] = "to_run"
-
-        with open(self.modules_db_name, 'w', encoding="utf-8") as f:
-            json.dump(modules_db, f)
-
-        if self.window_name == None: self.window_name = WindowName(accs_amount=len(modules_db))
-        else: self.window_name.accs_amount = len(modules_db)
+        if self.window_name == None: self.window_name = WindowName(accs_amount=accs_amount)
+        else: self.window_name.accs_amount = accs_amount
         self.window_name.set_modules(modules_amount=modules_len)
 
         return {
-            'accs_amount': len(modules_db),
+            'accs_amount': accs_amount,
             'modules_amount': modules_len,
         }
 
 
+    def commit(self, ops: list):
+        """Queues operations to writer thread, returns future resolved after they are written on disk"""
+        future = self.writer.submit("modules", ops)
+
+        self.journal_ops += len(ops)
+        if self.storage.COMPACT_EVERY and self.journal_ops >= self.storage.COMPACT_EVERY:
+            self.writer.submit("call", lambda snapshot=self.modules.dump(): self.storage.write_modules(
+                [snapshot], clear_reports=False
+            ))
+            self.journal_ops = 0
+
+        return future
+
+
     def get_all_modules(self):
         self.get_password()
-        with open(self.modules_db_name, encoding="utf-8") as f: modules_db = json.load(f)
 
-        if not modules_db:
+        if not self.modules.wallets:
             return 'No more accounts left'
 
         all_wallets_modules = [
             {
-                'privatekey': self.decode_pk(pk=encoded_privatekey),
                 'encoded_privatekey': encoded_privatekey,
-                'proxy': wallet_data.get("proxy"),
+                'proxy': wallet_data["proxy"],
                 'address': wallet_data["address"],
-                'module_info': wallet_data["modules"][0],
+                'module_info': dict(next(iter(wallet_data["modules"].values()))),
                 'last': True
             }
-            for encoded_privatekey, wallet_data in modules_db.items()
+            for encoded_privatekey, wallet_data in self.modules.wallets.items()
         ]
         if SHUFFLE_WALLETS:
             shuffle(all_wallets_modules)
         return all_wallets_modules
 
 
-    def get_random_module(self, active_wallets: list):
+    def claim_module(self):
+        """Picks module of wallet which is not running now, wallet is not picked again until `release_module`"""
         self.get_password()
-        with open(self.modules_db_name, encoding="utf-8") as f: modules_db = json.load(f)
-
-        all_wallets_modules = []
-        for encoded_privatekey, wallet_data in modules_db.items():
-            if wallet_data["address"] in active_wallets:
-                continue
-
-            sell_modules = [
-                module for module in wallet_data["modules"]
-                if (
-                           module["advance_info"] and
-                           module["module_name"] == "swap" and
-                           module["status"] == "to_run"
-                )
-            ]
-            back_bridge_modules = [
-                module for module in wallet_data["modules"]
-                if (
-                           module["advance_info"] and
-                           module["module_name"] == "bridge" and
-                           module["status"] == "to_run"
-                )
-            ]
-            wallet_modules = []
-            if len(back_bridge_modules) >= BRIDGE_SETTINGS["max_chains_hold"]:
-                wallet_modules += back_bridge_modules
-            if len(sell_modules) >= SWAP_SETTINGS["max_token_hold"]:
-                wallet_modules += sell_modules
-            if not wallet_modules:
-                wallet_modules = wallet_data["modules"]
-
-            all_wallets_modules += [
-                {
-                    'privatekey': self.decode_pk(pk=encoded_privatekey),
-                    'encoded_privatekey': encoded_privatekey,
-                    'proxy': wallet_data.get("proxy"),
-                    'address': wallet_data["address"],
-                    'module_info': module_info,
-                }
-                for module_info in wallet_modules
-                if module_info["status"] == "to_run"
-            ]
 
-        if not all_wallets_modules:
+        picked_module = self.modules.claim(randomly=SHUFFLE_WALLETS)
+        if picked_module is None:
             return 'No more accounts left'
-        elif SHUFFLE_WALLETS:
-            shuffle(all_wallets_modules)
-
-        return all_wallets_modules[0]
 
+        encoded_privatekey, module_id = picked_module
+        if reset_ops := self.modules.pop_pending_reset(encoded_pk=encoded_privatekey):
+            self.commit(reset_ops)
+        wallet_data = self.modules.wallets[encoded_privatekey]
+        return {
+            'encoded_privatekey': encoded_privatekey,
+            'proxy': wallet_data["proxy"],
+            'address': wallet_data["address"],
+            'module_info': dict(wallet_data["modules"][module_id]),
+        }
 
-    async def remove_module(self, module_data: dict):
-        async with self.changes_lock:
-            with open(self.modules_db_name, encoding="utf-8") as f: modules_db = json.load(f)
-            self.window_name.add_module()
-            for module_index, module in enumerate(modules_db[module_data["encoded_privatekey"]]["modules"]):
-                if module == {**module_data["module_info"], "status": "to_run"}:
-                    if module_data["module_info"]["status"] in [True, "completed"]:
-                        if len(modules_db[module_data["encoded_privatekey"]]["modules"]) == 1:
-                            self.window_name.add_acc()
-                            del modules_db[module_data["encoded_privatekey"]]
-                        else:
-                            modules_db[module_data["encoded_privatekey"]]["modules"].pop(module_index)
 
-                    else:
-                        modules_db[module_data["encoded_privatekey"]]["modules"][module_index]["status"] = "failed"
+    def release_module(self, module_data: dict):
+        self.modules.release(encoded_pk=module_data["encoded_privatekey"])
 
-                    break
 
-            with open(self.modules_db_name, 'w', encoding="utf-8") as f:
-                json.dump(modules_db, f)
+    async def remove_module(self, module_data: dict):
+        self.window_name.add_module()
+        future = self.commit(self.modules.remove_module(
+            encoded_pk=module_data["encoded_privatekey"],
+            module_info=module_data["module_info"],
+        ))
+        if module_data["encoded_privatekey"] not in self.modules.wallets:
+            self.window_name.add_acc()
+        await asyncio.wrap_future(future)
 
 
     async def remove_account(self, module_data: dict):
-        async with self.changes_lock:
-            with open(self.modules_db_name, encoding="utf-8") as f: modules_db = json.load(f)
-            self.window_name.add_acc()
-            if module_data["module_info"]["status"] in [True, "completed"]:
-                del modules_db[module_data["encoded_privatekey"]]
-            else:
-                modules_db[module_data["encoded_privatekey"]]["modules"] = [
-                    {**module, "status": "failed"}
-                    for module in modules_db[module_data["encoded_privatekey"]]["modules"]
-                ]
+        self.window_name.add_acc()
+        self.forget_privatekey(encoded_pk=module_data["encoded_privatekey"])
+        await asyncio.wrap_future(self.commit(self.modules.remove_account(
+            encoded_pk=module_data["encoded_privatekey"],
+            completed=module_data["module_info"]["status"] in [True, "completed"],
+        )))
 
-            with open(self.modules_db_name, 'w', encoding="utf-8") as f:
-                json.dump(modules_db, f)
 
+    async def mark_underfunded(self, encoded_pks: list, underfunded: set):
+        ops = []
+        for encoded_pk in encoded_pks:
+            ops += self.modules.set_underfunded(encoded_pk=encoded_pk, underfunded=encoded_pk in underfunded)
+        await asyncio.wrap_future(self.commit(ops))
 
-    async def add_wallet_module(self, encoded_pk: str, new_module: dict):
-        async with self.changes_lock:
-            with open(self.modules_db_name, encoding="utf-8") as f: modules_db = json.load(f)
-            modules_db[encoded_pk]["modules"].append(new_module)
 
-            with open(self.modules_db_name, 'w', encoding="utf-8") as f:
-                json.dump(modules_db, f)
+    async def add_wallet_module(self, encoded_pk: str, new_module: dict):
+        await asyncio.wrap_future(self.commit(self.modules.add_module(encoded_pk=encoded_pk, new_module=new_module)))
 
 
     async def get_wallet_modules_left(self, encoded_pk: str):
-        async with self.changes_lock:
-            with open(self.modules_db_name, encoding="utf-8") as f: modules_db = json.load(f)
-            if modules_db.get(encoded_pk) is None: return 0
-            return len([module for module in modules_db[encoded_pk]["modules"] if module["status"] == "to_run"])
+        return self.modules.get_wallet_modules_left(encoded_pk=encoded_pk)
 
 
     async def add_new_ref_code(self, address: str, code: str):
-        async with self.changes_lock:
-            with open(self.refs_db_name, encoding="utf-8") as f:
-                refs_db = json.load(f)
-            old_record = next((
-                ref_data for ref_data in refs_db
-                if ref_data["owner"] == address
-            ), None)
-            if old_record is None:
-                refs_db.append({
-                    "owner": address,
-                    "code": code,
-                    "used": False,
-                })
-                with open(self.refs_db_name, 'w', encoding="utf-8") as f:
-                    json.dump(refs_db, f)
+        await self.writer.commit("refs", self.refs.add_ref_code(address=address, code=code))
 
 
     async def get_ref_code(self, address: str):
-        async with self.changes_lock:
-            with open(self.refs_db_name, encoding="utf-8") as f:
-                refs_db = json.load(f)
-            old_record = next((
-                ref_data for ref_data in refs_db
-                if ref_data["owner"] == address
-            ), None)
-            if old_record or not refs_db:
-                return ""
-
-            if random() <= USE_REF_CHANCE / 100:
-                for ref_data in refs_db:
-                    if ref_data["used"]: continue
-                    ref_data["used"] = True
-                    with open(self.refs_db_name, 'w', encoding="utf-8") as f:
-                        json.dump(refs_db, f)
-
-                    return ref_data["code"]
-
-                return choice(refs_db)["code"] # if no free ref codes left
-
-            return ""
+        ref_code, ops = self.refs.get_ref_code(address=address, use_ref=random() <= USE_REF_CHANCE / 100)
+        await self.writer.commit("refs", ops)
+        return ref_code
 
 
     async def append_report(self, encoded_pk: str, text: str, success: bool = None):
         status_smiles = {True: '✅ ', False: "❌ ", None: ""}
-        async with self.changes_lock:
-
-            with open(self.report_db_name, encoding="utf-8") as f: report_db = json.load(f)
-
-            if not report_db.get(encoded_pk): report_db[encoded_pk] = {'texts': [], 'success_rate': [0, 0]}
-
-            report_db[encoded_pk]["texts"].append(status_smiles[success] + text)
-            if success != None:
-                report_db[encoded_pk]["success_rate"][1] += 1
-                if success == True: report_db[encoded_pk]["success_rate"][0] += 1
-
-            with open(self.report_db_name, 'w') as f: json.dump(report_db, f)
+        await self.writer.commit("report", (encoded_pk, status_smiles[success] + text, success))
 
 
     async def get_account_reports(self, encoded_pk: str, get_rate: bool = False):
-        async with self.changes_lock:
-            with open(self.report_db_name, encoding="utf-8") as f: report_db = json.load(f)
-
-            decoded_privatekey = self.decode_pk(pk=encoded_pk)
-            account_index = f"[{self.window_name.accs_done}/{self.window_name.accs_amount}]"
+        decoded_privatekey = self.get_privatekey(encoded_pk=encoded_pk)
+        if not get_rate: self.forget_privatekey(encoded_pk=encoded_pk)
+        account_index = f"[{self.window_name.accs_done}/{self.window_name.accs_amount}]"
 
-            if report_db.get(encoded_pk):
-                account_reports = report_db[encoded_pk]
-                if get_rate: return f'{account_reports["success_rate"][0]}/{account_reports["success_rate"][1]}'
-                del report_db[encoded_pk]
+        account_reports = await self.writer.call(self.storage.get_reports, encoded_pk=encoded_pk, consume=not get_rate)
+        if account_reports:
+            if get_rate: return f'{account_reports["success_rate"][0]}/{account_reports["success_rate"][1]}'
 
-                with open(self.report_db_name, 'w', encoding="utf-8") as f: json.dump(report_db, f)
+            logs_text = '\n'.join(account_reports['texts'])
+            tg_text = f'{account_index} <b>{get_address(pk=decoded_privatekey)}</b>\n\n{logs_text}'
+            if account_reports["success_rate"][1]:
+                tg_text += f'\n\nSuccess rate {account_reports["success_rate"][0]}/{account_reports["success_rate"][1]}'
 
-                logs_text = '\n'.join(account_reports['texts'])
-                tg_text = f'{account_index} <b>{get_address(pk=decoded_privatekey)}</b>\n\n{logs_text}'
-                if account_reports["success_rate"][1]:
-                    tg_text += f'\n\nSuccess rate {account_reports["success_rate"][0]}/{account_reports["success_rate"][1]}'
+            return tg_text
 
-                return tg_text
-
-            else:
-                return f'{account_index} <b>{get_address(pk=decoded_privatekey)}</b>\n\nNo actions'
+        else:
+            return f'{account_index} <b>{get_address(pk=decoded_privatekey)}</b>\n\nNo actions'
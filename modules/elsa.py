@@ -10,14 +10,19 @@ import re
 
 from modules.utils import get_current_date, round_cut, make_border
 from modules.rpc_initializer import RPCInitializer
+from modules.allowance_ledger import AllowanceLedger
+from modules.token_registry import TokenRegistry
+from modules.rsc_parser import PipelineResponse
 from modules.retry import CustomError, retry
-from modules.config import TOKEN_ADDRESSES
 from modules.browser import Browser
 from modules.wallet import Wallet
 from settings import SWAP_SETTINGS, BRIDGE_SETTINGS, MINT_NFT
 
 
 class Elsa:
+
+    SUGGESTION_PATTERN: re.Pattern = re.compile(r':suggestion\[(.*?)\]')
+
     def __init__(self, wallet: Wallet, browser: Browser):
         self.wallet = wallet
         self.browser = browser
@@ -187,7 +192,6 @@ class Elsa:
         ai_response = await self.process_elsa_swap_or_bridge(chat_id=chat_id, ai_response=ai_response)
 
         from_chain = ai_response["tx"]["json_data"]["estimate"]["from_chain"]
-        web3 = self.wallet.get_web3(from_chain)
         action_name = ai_response["tx"]["json_data"]["short_description"]
         tx_label = action_name[0].lower() + action_name[1:]
         self.log_message(action_name)
@@ -204,6 +208,7 @@ class Elsa:
                 action="signed_message"
             )
             await self.wallet.wait_balance(chain_name=from_chain, needed_balance=old_balance, only_more=True)
+            AllowanceLedger.invalidate(chain_name=from_chain, owner=self.wallet.address)
             # todo: mb add последний запрос для красоты (после свапа через подпись)
 
             self.log_message(action_name, "+", "SUCCESS")
@@ -222,14 +227,14 @@ class Elsa:
                 "gas": int(ai_response["tx"]["json_data"]["evm_tx_data"]["gas"], 16),
                 "value": int(ai_response["tx"]["json_data"]["evm_tx_data"]["value"], 16),
                 'chainId': int(ai_response["tx"]["json_data"]["evm_tx_data"]["chain_id"], 16),
-                'nonce': await web3.eth.get_transaction_count(self.wallet.address),
             }
-            tx_hash = await self.wallet.sent_tx(
+            tx_hash = await self.wallet.send_tx(
                 chain_name=from_chain,
                 tx=tx,
                 tx_label=tx_label,
                 tx_raw=True,
             )
+            AllowanceLedger.invalidate(chain_name=from_chain, owner=self.wallet.address)
 
             await self.browser.send_pipeline_data(
                 chat_id=ai_response["chat"]["id"],
@@ -286,7 +291,6 @@ class Elsa:
         ai_response = await self.process_elsa_swap_or_bridge(chat_id=chat_id, ai_response=ai_response)
 
         from_chain = ai_response["tx"]["json_data"]["estimate"]["from_chain"]
-        web3 = self.wallet.get_web3(from_chain)
         action_name = ai_response["tx"]["json_data"]["short_description"]
         tx_label = action_name[0].lower() + action_name[1:]
         self.log_message(action_name)
@@ -299,14 +303,14 @@ class Elsa:
             "gas": int(ai_response["tx"]["json_data"]["evm_tx_data"]["gas"], 16),
             "value": int(ai_response["tx"]["json_data"]["evm_tx_data"]["value"], 16),
             'chainId': int(ai_response["tx"]["json_data"]["evm_tx_data"]["chain_id"], 16),
-            'nonce': await web3.eth.get_transaction_count(self.wallet.address),
         }
-        tx_hash = await self.wallet.sent_tx(
+        tx_hash = await self.wallet.send_tx(
             chain_name=from_chain,
             tx=tx,
             tx_label=tx_label,
             tx_raw=True,
         )
+        AllowanceLedger.invalidate(chain_name=from_chain, owner=self.wallet.address)
 
         r = await self.browser.send_pipeline_data(
             chat_id=ai_response["chat"]["id"],
@@ -377,7 +381,7 @@ Expiration Time: {expired_at}"""
             error_text: str,
     ):
         self.log_message(f'Ask Elsa "<white>{question}</white>"')
-        ai_resp, chat_id = await self.browser.ask_ai(question)
+        ai_resp, chat_id = await self.browser.ask_ai(question, wait_tool=ai_response_tool_name)
         ai_response = self.format_response(ai_resp, ai_response_tool_name)
         if ai_response["formatted_resp"] is None:
             if ai_response["buttons"]:
@@ -394,7 +398,8 @@ Expiration Time: {expired_at}"""
                     ai_resp, chat_id = await self.browser.ask_ai(
                         question=agree_button,
                         previous_message=ai_response["previous_message"],
-                        chat_id=chat_id
+                        chat_id=chat_id,
+                        wait_tool=ai_response_tool_name,
                     )
                     ai_response = self.format_response(ai_resp, ai_response_tool_name)
                     if ai_response["formatted_resp"] is None:
@@ -446,15 +451,13 @@ Expiration Time: {expired_at}"""
             pipeline_data=pipeline_data,
             action="create_swap"
         )
-        pipeline_resp = self.format_response_by_num(pipeline_resp_raw.text, "1")
-        if (
-                pipeline_resp.get("status") != 200 or
-                pipeline_resp.get("data") is None or
-                pipeline_resp["data"].get("pipeline_id") is None
-        ):
-            raise Exception(f'Unexpected pipeline id response: {pipeline_resp}')
-        pipeline_id = pipeline_resp["data"]["pipeline_id"]
+        pipeline_resp = PipelineResponse(pipeline_resp_raw.content)
+        pipeline_id = pipeline_resp.pipeline_id
+        if pipeline_id is None:
+            raise Exception(f'Unexpected pipeline id response: {pipeline_resp.result}')
 
+        skipped_approve = None  # approve step is polled every round, it's counted as skipped once if no tx was sent for it
+        approve_sent = False
         while True:
             r = await self.browser.send_pipeline_data(
                 chat_id=chat_id,
@@ -462,34 +465,20 @@ Expiration Time: {expired_at}"""
                 action="get_swap_data"
             )
 
-            sign_message_raw_resp = self.format_response_by_num(r.text, "1")
-            tx_raw_resp = self.format_response_by_num(r.text, "2", json_format=False)
-            if tx_raw_resp:
-                tx_raw_resp = tx_raw_resp[tx_raw_resp.find(',') + 1:]
-                json_resp = loads(tx_raw_resp.split('1:')[1])
-                tx_data = tx_raw_resp.split('1:')[0]
-                tx_json_data = next((action for action in json_resp["data"] if action.get("action_type") == "swap"), None)
+            pipeline_resp = PipelineResponse(r.content)
+            if pipeline_resp.tx_data:
+                tx_json_data = pipeline_resp.get_action("swap")
                 if tx_json_data is None:
-                    raise Exception(f'Failed to get transaction data: {json_resp}')
+                    raise Exception(f'Failed to get transaction data: {pipeline_resp.result}')
                 tx = {
                     "json_data": tx_json_data,
-                    "data": tx_data
+                    "data": pipeline_resp.tx_data
                 }
                 break
 
-            elif sign_message_raw_resp:
-                approve_response = next(
-                    (
-                        raw_resp for raw_resp in sign_message_raw_resp["data"]
-                        if raw_resp["action_type"] == "approve"
-                    ), None
-                )
-                swap_response = next(
-                    (
-                        raw_resp for raw_resp in sign_message_raw_resp["data"]
-                        if raw_resp["action_type"] == "swap"
-                    ), None
-                )
+            elif pipeline_resp.result:
+                approve_response = pipeline_resp.get_action("approve")
+                swap_response = pipeline_resp.get_action("swap")
 
                 if swap_response and swap_response.get("evm_typed_data"):
                     sign_typed_data = {
@@ -515,30 +504,36 @@ Expiration Time: {expired_at}"""
                     break
 
                 elif approve_response and approve_response.get("evm_tx_data"):
-                    token_contract = w3.eth.contract(
-                        abi='[{"inputs":[{"internalType":"address","name":"spender","type":"address"},{"internalType":"uint256","name":"value","type":"uint256"}],"name":"approve","outputs":[{"internalType":"bool","name":"","type":"bool"}],"stateMutability":"nonpayable","type":"function"}]',
-                    )
-                    spender = token_contract.decode_function_input(approve_response["evm_tx_data"]["data"])[1]["spender"]
-                    value_approve = token_contract.decode_function_input(approve_response["evm_tx_data"]["data"])[1]["value"]
+                    approve_args = TokenRegistry.decode_call(approve_response["evm_tx_data"]["data"])[1]
+                    spender = approve_args["spender"]
+                    value_approve = approve_args["value"]
 
                     if swap_data["from_asset"].startswith("0x"):
-                        approve_token_name = next(
-                            (
-                                token_name for token_name, token_address
-                                in TOKEN_ADDRESSES[swap_data["from_chain"]].items()
-                                if token_address.lower() == swap_data["from_asset"].lower()
-                            ), None
-                        )
+                        approve_token_name = TokenRegistry.get_token_name(swap_data["from_chain"], swap_data["from_asset"])
                     else:
                         approve_token_name = swap_data["from_asset"]
 
-                    tx_hash = await self.wallet.approve(
-                        chain_name=swap_data["from_chain"],
-                        token_name=approve_token_name,
-                        spender=spender,
-                        value=value_approve,  # `float(swap_data["amount"])` for correct amount
-                        force_approve=True
-                    )
+                    approve_params = {
+                        "chain_name": swap_data["from_chain"],
+                        "token_name": approve_token_name,
+                        "spender": spender,
+                        "value": value_approve,  # `float(swap_data["amount"])` for correct amount
+                    }
+                    tx_hash = await self.wallet.approve(**approve_params)
+                    if tx_hash is False:
+                        # allowance is enough: report saved approve of spender, send new one only if wallet never approved it
+                        skipped_approve = approve_params
+                        tx_hash = AllowanceLedger.get_approve_tx(
+                            chain_name=swap_data["from_chain"],
+                            owner=self.wallet.address,
+                            token_name=approve_token_name,
+                            spender=spender,
+                        )
+                        if tx_hash is None and approve_response["status"] == "sign_pending":
+                            tx_hash = await self.wallet.approve(**approve_params, force_approve=True)
+                            approve_sent = True
+                    else:
+                        approve_sent = True
                     if approve_response["status"] == "sign_pending":
                         r = await self.browser.send_pipeline_data(
                             chat_id=chat_id,
@@ -552,6 +547,9 @@ Expiration Time: {expired_at}"""
 
             await asyncio.sleep(3)
 
+        if skipped_approve and not approve_sent:
+            AllowanceLedger.on_skipped(skipped_approve["chain_name"], self.wallet.address, skipped_approve["token_name"])
+
         return {
             "tx": tx,
             "chat": {
@@ -592,14 +590,10 @@ Expiration Time: {expired_at}"""
             action="create_swap"
         )
 
-        pipeline_resp = self.format_response_by_num(pipeline_resp_raw.text, "1")
-        if (
-                pipeline_resp.get("status") != 200 or
-                pipeline_resp.get("data") is None or
-                pipeline_resp["data"].get("pipeline_id") is None
-        ):
-            raise Exception(f'Unexpected pipeline id response: {pipeline_resp}')
-        pipeline_id = pipeline_resp["data"]["pipeline_id"]
+        pipeline_resp = PipelineResponse(pipeline_resp_raw.content)
+        pipeline_id = pipeline_resp.pipeline_id
+        if pipeline_id is None:
+            raise Exception(f'Unexpected pipeline id response: {pipeline_resp.result}')
 
         while True:
             r = await self.browser.send_pipeline_data(
@@ -608,15 +602,14 @@ Expiration Time: {expired_at}"""
                 action="get_swap_data"
             )
 
-            mint_nft_data = self.format_response_by_num(r.text, "1")
-            if mint_nft_data and mint_nft_data.get("data") and mint_nft_data["data"][0].get("evm_tx_data"):
-                mint_tx_data = mint_nft_data["data"][0]
+            mint_nft_data = PipelineResponse(r.content).actions
+            if mint_nft_data and mint_nft_data[0].get("evm_tx_data"):
+                mint_tx_data = mint_nft_data[0]
                 break
 
             await asyncio.sleep(3)
 
         from_chain = "base"
-        web3 = self.wallet.get_web3(from_chain)
         tx_label = mint_tx_data["short_description"][:1].lower() + mint_tx_data["short_description"][1:]
 
         tx = {
@@ -626,9 +619,8 @@ Expiration Time: {expired_at}"""
             "gas": int(mint_tx_data["evm_tx_data"]["gas"], 16),
             "value": int(mint_tx_data["evm_tx_data"]["value"], 16),
             'chainId': int(mint_tx_data["evm_tx_data"]["chain_id"], 16),
-            'nonce': await web3.eth.get_transaction_count(self.wallet.address),
         }
-        tx_hash = await self.wallet.sent_tx(
+        tx_hash = await self.wallet.send_tx(
             chain_name=from_chain,
             tx=tx,
             tx_label=tx_label,
@@ -673,65 +665,93 @@ Expiration Time: {expired_at}"""
 
     @classmethod
     def format_response(cls, response_text: str, label: str):
-        formatted_responses = []
-        splitted_text = response_text.splitlines()
-        for index, part_text in enumerate(splitted_text):
-            # start of new part
-            if part_text.startswith("f:"):
-                message_id = loads(part_text[2:])["messageId"]
-                formatted_responses.append({"message_id": message_id})
-            # human text
-            elif part_text.startswith("0:"):
-                # if len(formatted_responses[-1]) == 1:
-                if formatted_responses[-1].get("response") is None:
-                    formatted_responses[-1]["response"] = ""
-                formatted_responses[-1]["response"] += part_text[3:-1]
-            # json
-            else:
-                part_text = part_text[2:]
-                if part_text.startswith("{") and part_text.endswith("}"):
-                    if formatted_responses[-1].get("response") is None:
-                        formatted_responses[-1]["response"] = {}
-                    json_part = loads(part_text)
-                    if json_part.get("toolCallId"):
-                        formatted_responses[-1]["response"].update(json_part)
-
-        # GET TEXT AI ANSWER
-        text_raw_resp = next((
-            resp for resp in formatted_responses
-            if (
-                type(resp["response"]) == str
-        )
-        ), None)
+        """
+        Parses /api/chat data stream in one walk over lines
 
-        # FORMAT ANSWER FOR NEXT QUESTION (previous_message)
-        message_parts = []
+        formatted_responses: list[dict]
+        [
+            {
+                "message_id": (str),
+                "response": (
+                    str: ai_response_text |
+                    dict: {
+                        "toolCallId": str,
+                        "toolName": str,
+                        "args": dict,
+                        "result": dict,
+                    }
+                )
+            },
+        ]
+        """
+        formatted_responses = []
+        message_parts = []          # for next question (previous_message)
         tool_invocations = []
-        for part_index, part_response in enumerate(formatted_responses):
-            if type(part_response["response"]) == dict:
+        text_raw_resp = None
+        formatted_resp = None
+        buttons = None
+
+        def close_part(part: dict):
+            nonlocal text_raw_resp, formatted_resp, buttons
+            response = part.get("response")
+            if type(response) == dict and "toolCallId" in response:
                 tool_invocation = {
                     "state": "result",
-                    "toolCallId": part_response["response"]["toolCallId"],
-                    "toolName": part_response["response"]["toolName"],
-                    "args": part_response["response"]["args"],
-                    "result": part_response["response"]["result"]
+                    "toolCallId": response["toolCallId"],
+                    "toolName": response["toolName"],
+                    "args": response["args"],
+                    "result": response["result"]
                 }
                 message_parts.append({
                     "type": "tool-invocation",
                     "toolInvocation": {
                         **tool_invocation,
-                        "step": part_index,
+                        "step": len(formatted_responses) - 1,
                     }
                 })
                 tool_invocations.append({
                     **tool_invocation,
                     "step": len(tool_invocations)
                 })
-            else:
+                if formatted_resp is None and response.get("toolName") == label:
+                    formatted_resp = part
+
+            elif type(response) == str:
                 message_parts.append({
                     "type": "text",
-                    "text": part_response["response"]
+                    "text": response
                 })
+                if text_raw_resp is None:
+                    text_raw_resp = part
+                buttons = cls.SUGGESTION_PATTERN.findall(response)
+
+        part = None
+        text = None
+        for part_text in response_text.splitlines():
+            prefix = part_text[:2]
+            # start of new part
+            if prefix == "f:":
+                if part is not None:
+                    if text is not None: part["response"] = text
+                    close_part(part)
+                text = None
+                part = {"message_id": loads(part_text[2:])["messageId"]}
+                formatted_responses.append(part)
+            # human text
+            elif prefix == "0:":
+                text = part_text[3:-1] if text is None else text + part_text[3:-1]
+            # json
+            elif part is not None and text is None and part_text.startswith("{", 2) and part_text.endswith("}"):
+                if part.get("response") is None:
+                    part["response"] = {}
+                if '"toolCallId"' in part_text:
+                    json_part = loads(part_text[2:])
+                    if json_part.get("toolCallId"):
+                        part["response"].update(json_part)
+
+        if part is not None:
+            if text is not None: part["response"] = text
+            close_part(part)
 
         previous_message = {
             "createdAt": get_current_date(),
@@ -746,37 +766,6 @@ Expiration Time: {expired_at}"""
                 "content": text_raw_resp["response"],
             })
 
-        buttons = None
-        for el in formatted_responses:
-            if type(el["response"]) == str:
-                buttons = re.findall(r':suggestion\[(.*?)\]', el["response"])
-
-        """
-        formatted_responses: list[dict]
-        [
-            {
-                "message_id": (str),
-                "response": (
-                    str: ai_response_text |
-                    dict: {
-                        "toolCallId": str,
-                        "toolName": str,
-                        "args": dict,
-                        "result": dict,
-                    }
-                )
-            },
-        ]
-        """
-
-        formatted_resp = next((
-            resp for resp in formatted_responses
-            if (
-                type(resp["response"]) == dict and
-                resp["response"].get("toolName") == label
-            )
-        ), None)
-
         return {
             "formatted_resp": formatted_resp,
             "previous_message": previous_message,
@@ -785,19 +774,6 @@ Expiration Time: {expired_at}"""
             "buttons": buttons,
         }
 
-    @classmethod
-    def format_response_by_num(cls, response_text: str, index: str | int, json_format: bool = True):
-        for text_part in response_text.splitlines():
-            if text_part.startswith(f"{index}:"):
-                text_part = text_part.removeprefix(f"{index}:")
-                if json_format:
-                    if text_part.startswith("{") and text_part.endswith("}"):
-                        return loads(text_part)
-                else:
-                    return text_part
-        return None
-
-
     def log_message(
             self,
             text: str,
@@ -0,0 +1,101 @@
+from loguru import logger
+from time import monotonic
+import asyncio
+
+from modules.rpc_initializer import RPCInitializer
+from modules.chain_service import ChainService
+import modules.config as config
+import settings
+
+
+class GasOracle(ChainService):
+    """
+    Process-wide gas data per chain. Fetched at most once per block time and
+    shared by every wallet; concurrent callers wait for the same request.
+    """
+
+    @classmethod
+    def _create_state(cls, chain_name: str):
+        return {
+            "web3": RPCInitializer.create_web3(chain_name, sticky=True),
+            "ttl": config.get_block_time(chain_name),
+            "data": None,               # {"max_priority", "base_fee", "gas_used", "gas_limit", "gas_price"}
+            "updated_at": 0.0,
+            "refreshing": None,         # in-flight refresh task
+            "updated": asyncio.Condition(),
+            "watcher": None,
+            "subscribers": 0,
+        }
+
+
+    @classmethod
+    async def get_data(cls, chain_name: str):
+        state = cls._get_state(chain_name)
+        if state["data"] is None or monotonic() - state["updated_at"] >= state["ttl"]:
+            if state["refreshing"] is None or state["refreshing"].done():
+                state["refreshing"] = asyncio.ensure_future(cls._refresh(state))
+            await asyncio.shield(state["refreshing"])
+        return state["data"]
+
+
+    @classmethod
+    async def _refresh(cls, state: dict):
+        web3 = state["web3"]
+        max_priority, last_block, gas_price = await asyncio.gather(
+            web3.eth.max_priority_fee,
+            web3.eth.get_block('latest'),
+            web3.eth.gas_price,
+        )
+        state["data"] = {
+            "max_priority": int(max_priority),
+            "base_fee": last_block['baseFeePerGas'],
+            "gas_used": last_block['gasUsed'],
+            "gas_limit": last_block['gasLimit'],
+            "gas_price": gas_price,
+        }
+        state["updated_at"] = monotonic()
+        async with state["updated"]:
+            state["updated"].notify_all()
+
+
+    @classmethod
+    async def get_gas(cls, chain_name: str, increasing_gwei: float = 0):
+        data = await cls.get_data(chain_name)
+
+        base_fee = int(max(data["base_fee"], data["gas_price"]) * (settings.GWEI_MULTIPLIER + increasing_gwei))
+        block_filled = data["gas_used"] / data["gas_limit"] * 100
+        if block_filled > 50:
+            base_fee = int(base_fee * 1.127)
+
+        max_fee = int(base_fee + data["max_priority"])
+        return {'maxPriorityFeePerGas': data["max_priority"], 'maxFeePerGas': max_fee}
+
+
+    @classmethod
+    async def subscribe(cls, chain_name: str):
+        """Yields gas price in gwei on every refresh, chain is refreshed in background while anyone is subscribed"""
+        state = cls._get_state(chain_name)
+        state["subscribers"] += 1
+        if state["watcher"] is None or state["watcher"].done():
+            state["watcher"] = asyncio.ensure_future(cls._watch(chain_name, state))
+
+        try:
+            data = await cls.get_data(chain_name)
+            while True:
+                yield round(data["gas_price"] / 10 ** 9, 2)
+                async with state["updated"]:
+                    await state["updated"].wait()
+                data = state["data"]
+        finally:
+            state["subscribers"] -= 1
+
+
+    @classmethod
+    async def _watch(cls, chain_name: str, state: dict):
+        while state["subscribers"] > 0:
+            await asyncio.sleep(state["ttl"])
+            try:
+                await cls.get_data(chain_name)
+            except Exception as err:
+                logger.warning(f'[•] Gas | {chain_name.title()} gas oracle error: {err}')
+                await asyncio.sleep(10)
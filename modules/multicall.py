@@ -1,31 +1,48 @@
+from eth_utils.abi import collapse_if_tuple, function_abi_to_4byte_selector
 from eth_typing.evm import Address
 from web3.auto import w3
+import asyncio
 
 from modules.rpc_initializer import RPCInitializer
 
 
 class MultiCall:
+    """
+    Calls of many contracts in aggregate3 requests. Selector, input and output types
+    are compiled once per (contract, function), calls are split into chunks by
+    `CHUNK_SIZE` and `CHUNK_BYTES` and chunks are sent concurrently.
+    """
+
     multicall_address: Address = "0xcA11bde05977b3631167028862bE2a173976CA11"
     multicall_abi: str = '[{"inputs":[{"components":[{"internalType":"address","name":"target","type":"address"},{"internalType":"bool","name":"allowFailure","type":"bool"},{"internalType":"bytes","name":"callData","type":"bytes"}],"internalType":"structMulticall3.Call3[]","name":"calls","type":"tuple[]"}],"name":"aggregate3","outputs":[{"components":[{"internalType":"bool","name":"success","type":"bool"},{"internalType":"bytes","name":"returnData","type":"bytes"}],"internalType":"structMulticall3.Result[]","name":"returnData","type":"tuple[]"}],"stateMutability":"payable","type":"function"},{"inputs":[{"internalType":"address","name":"addr","type":"address"}],"name":"getEthBalance","outputs":[{"internalType":"uint256","name":"balance","type":"uint256"}],"stateMutability":"view","type":"function"}]'
 
+    AGGREGATE3_SELECTOR: bytes = bytes.fromhex("82ad56cb")
+    CHUNK_SIZE: int = 500               # calls in one aggregate3, keeps eth_call under rpc gas cap
+    CHUNK_BYTES: int = 64 * 1024        # calldata bytes in one aggregate3
+    CONCURRENCY: int = 4                # aggregate3 requests in flight per `call`
+
+    functions: dict = {}                # (contract address, func name): compiled function, see `get_function`
+
     @classmethod
     async def call(cls, chain_name: str, call_data: dict, **kwargs):
-        contract = RPCInitializer.initialize_contract(
-            chain_name=chain_name,
-            address=cls.multicall_address,
-            abi=cls.multicall_abi
-        )
-
-        call_response = await contract.functions.aggregate3([
-            [
+        calls = []
+        for k in call_data:
+            function = cls.get_function(call_data[k])
+            calls.append((
                 call_data[k]["contract"].address,
                 True,
-                call_data[k]["contract"].functions[call_data[k]["func"]](*call_data[k]["args"])._encode_transaction_data()
-            ]
-            for k in call_data
-        ]).call()
+                function["selector"] + w3.codec.encode(function["input_types"], call_data[k]["args"])
+            ))
+
+        semaphore = asyncio.Semaphore(cls.CONCURRENCY)
+        async def call_chunk(chunk: list):
+            async with semaphore:
+                return await cls.aggregate3(chain_name=chain_name, calls=chunk)
+
+        chunks_responses = await asyncio.gather(*[call_chunk(chunk) for chunk in cls.split_calls(calls)])
 
         call_result = {}
+        call_response = (resp for chunk_responses in chunks_responses for resp in chunk_responses)
         for token_name, resp in zip(call_data, call_response):
             if resp[0]:
                 readable_response, abi_types = cls.decode_resp(call_data[token_name], resp[1])
@@ -38,21 +55,87 @@ class MultiCall:
         return call_result
 
 
+    @classmethod
+    async def aggregate3(cls, chain_name: str, calls: list):
+        """Returns [(success, return data)] of calls, encoded without contract object"""
+        raw_response = await RPCInitializer.get_rpc(chain_name).eth.call({
+            "to": cls.multicall_address,
+            "data": w3.to_hex(cls.AGGREGATE3_SELECTOR + w3.codec.encode(["(address,bool,bytes)[]"], [calls])),
+        })
+        return w3.codec.decode(["(bool,bytes)[]"], raw_response)[0]
+
+
+    @classmethod
+    def split_calls(cls, calls: list):
+        chunk, chunk_bytes = [], 0
+        for call in calls:
+            if chunk and (len(chunk) >= cls.CHUNK_SIZE or chunk_bytes + len(call[2]) > cls.CHUNK_BYTES):
+                yield chunk
+                chunk, chunk_bytes = [], 0
+            chunk.append(call)
+            chunk_bytes += len(call[2])
+        if chunk:
+            yield chunk
+
+
+    @classmethod
+    def get_function(cls, token_data: dict):
+        key = (token_data["contract"].address, token_data["func"])
+        function = cls.functions.get(key)
+        if function is None:
+            for _func in token_data["contract"].abi:
+                if _func.get("type", "function") == "function" and _func.get("name") == token_data["func"]:
+                    break
+            else:
+                raise ValueError(f'No function "{token_data["func"]}" in {token_data["contract"].address} abi')
+
+            output_types = []
+            for func in _func["outputs"]:
+                if func["type"] == "tuple" and func.get("components"):
+                    output_types += [collapse_if_tuple(comp) for comp in func["components"]]
+                else:
+                    output_types.append(func["type"])
+
+            function = cls.functions[key] = {
+                "selector": function_abi_to_4byte_selector(_func),
+                "input_types": [collapse_if_tuple(func) for func in _func["inputs"]],
+                "output_types": output_types,
+                "decoder": cls.compile_decoder(output_types),
+            }
+        return function
+
+
+    @staticmethod
+    def compile_decoder(abi_types: list):
+        """Outputs of only static one-word types (uint, int, bool) are sliced from response without eth_abi"""
+        word_decoders = []
+        for abi_type in abi_types:
+            if abi_type.startswith("uint") and "[" not in abi_type:
+                word_decoders.append(lambda word: int.from_bytes(word, "big"))
+            elif abi_type.startswith("int") and "[" not in abi_type:
+                word_decoders.append(lambda word: int.from_bytes(word, "big", signed=True))
+            elif abi_type == "bool":
+                word_decoders.append(lambda word: word[-1] == 1)
+            else:
+                return lambda resp: w3.codec.decode(abi_types, resp)
+
+        words_length = 32 * len(word_decoders)
+        def decode_words(resp: bytes):
+            if len(resp) < words_length:
+                raise ValueError(f'Response of {len(resp)} bytes is too short for {abi_types}')
+            return tuple(decoder(resp[i * 32:i * 32 + 32]) for i, decoder in enumerate(word_decoders))
+
+        return decode_words
+
+
     @classmethod
     def decode_resp(cls, token_data: dict, resp: bytes):
-        for _func in token_data["contract"].abi:
-            if _func["name"] == token_data["func"]:
-                abi_types = []
-                for func in _func["outputs"]:
-                    if func["type"] == "tuple" and func.get("components"):
-                        abi_types += [comp["type"] for comp in func["components"]]
-                    else:
-                        abi_types.append(func["type"])
-                break
+        function = cls.get_function(token_data)
+        abi_types = function["output_types"]
 
         if len(abi_types) == 1:
-            readable_response = w3.codec.decode(abi_types, resp)[0]
+            readable_response = function["decoder"](resp)[0]
         else:
-            readable_response = w3.codec.decode(abi_types, resp)
+            readable_response = function["decoder"](resp)
 
         return readable_response, abi_types
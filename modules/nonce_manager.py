@@ -0,0 +1,50 @@
+import asyncio
+
+
+class NonceManager:
+    """
+    Local nonce per (chain, address): fetched from node once, then incremented
+    on every broadcasted tx. Dropped and fetched again after failed broadcast.
+    """
+
+    accounts: dict = {}     # (chain_name, address): {"nonce": int | None, "lock": asyncio.Lock}
+
+    @classmethod
+    def _get_account(cls, chain_name: str, address: str):
+        loop = asyncio.get_running_loop()
+        account = cls.accounts.get((chain_name, address))
+        if account is None or account["loop"] is not loop:
+            account = cls.accounts[(chain_name, address)] = {"nonce": None, "lock": asyncio.Lock(), "loop": loop}
+        return account
+
+
+    @classmethod
+    def lock(cls, chain_name: str, address: str):
+        """Hold from taking nonce till broadcast, so txs of one account never get the same nonce"""
+        return cls._get_account(chain_name, address)["lock"]
+
+
+    @classmethod
+    async def get_nonce(cls, web3, chain_name: str, address: str):
+        account = cls._get_account(chain_name, address)
+        if account["nonce"] is None:
+            account["nonce"] = await web3.eth.get_transaction_count(address, 'pending')
+        return account["nonce"]
+
+
+    @classmethod
+    def increment(cls, chain_name: str, address: str):
+        account = cls._get_account(chain_name, address)
+        if account["nonce"] is not None:
+            account["nonce"] += 1
+
+
+    @classmethod
+    def reset(cls, chain_name: str, address: str):
+        cls._get_account(chain_name, address)["nonce"] = None
+
+
+    @staticmethod
+    def is_nonce_error(error: Exception):
+        error_text = str(error).lower()
+        return "nonce too low" in error_text or "nonce is too low" in error_text
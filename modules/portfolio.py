@@ -0,0 +1,96 @@
+from loguru import logger
+import asyncio
+
+from modules.rpc_initializer import RPCInitializer
+from modules.token_registry import TokenRegistry
+from modules.multicall import MultiCall
+from modules.database import DataBase
+from modules.utils import make_border
+import modules.config as config
+
+from settings import BRIDGE_SETTINGS, MIN_ETH_BALANCE
+
+
+class Portfolio:
+    """Balances snapshot of all wallets through MultiCall, marks underfunded wallets before run"""
+
+    def __init__(self, db: DataBase):
+        self.db = db
+        self.chains = list(dict.fromkeys(["base", *BRIDGE_SETTINGS["to_chains"]]))
+
+
+    async def snapshot(self):
+        wallets = self.db.get_wallet_addresses()
+        if not wallets:
+            logger.warning(f'[-] Portfolio | No accounts in database')
+            return
+
+        logger.info(f'[•] Portfolio | Checking balances of {len(wallets)} accounts in {", ".join(self.chains)}')
+        chains_balances = await asyncio.gather(*[
+            self.get_chain_balances(chain_name=chain_name, addresses=list(wallets.values()))
+            for chain_name in self.chains
+        ], return_exceptions=True)
+
+        balances = {}   # address: {chain_name: {token_name: amount}}
+        totals = {}     # "chain_name token_name": amount
+        for chain_name, chain_balances in zip(self.chains, chains_balances):
+            if isinstance(chain_balances, Exception):
+                logger.error(f'[-] Portfolio | Failed to get {chain_name.title()} balances: {chain_balances}')
+                continue
+            for address, tokens in chain_balances.items():
+                balances.setdefault(address, {})[chain_name] = tokens
+                for token_name, amount in tokens.items():
+                    totals[f'{chain_name.title()} {token_name}'] = totals.get(f'{chain_name.title()} {token_name}', 0) + amount
+
+        if "base" not in balances.get(next(iter(wallets.values())), {}):
+            logger.error(f'[-] Portfolio | No Base balances, underfunded accounts are not marked')
+            return balances
+
+        underfunded = {
+            encoded_pk for encoded_pk, address in wallets.items()
+            if balances[address]["base"]["ETH"] < MIN_ETH_BALANCE
+        }
+        await self.db.mark_underfunded(encoded_pks=list(wallets), underfunded=underfunded)
+
+        for encoded_pk in underfunded:
+            logger.warning(f'[-] {wallets[encoded_pk]} | Underfunded: {round(balances[wallets[encoded_pk]]["base"]["ETH"], 6)} ETH in Base')
+        logger.opt(colors=True).info("Portfolio:\n" + make_border(
+            table_elements={
+                "Accounts": len(wallets),
+                "Underfunded": len(underfunded),
+                **{name: round(amount, 6) for name, amount in totals.items() if amount},
+            },
+            values_color="white"
+        ))
+        return balances
+
+
+    async def get_chain_balances(self, chain_name: str, addresses: list):
+        """Returns {address: {"ETH": amount, token_name: amount}}"""
+        multicall_contract = RPCInitializer.initialize_contract(
+            chain_name=chain_name,
+            address=MultiCall.multicall_address,
+            abi=MultiCall.multicall_abi,
+        )
+        tokens = {
+            token_name: TokenRegistry.get_contract(chain_name=chain_name, address=token_address)
+            for token_name, token_address in config.TOKEN_ADDRESSES.get(chain_name, {}).items()
+        }
+        decimals = {"ETH": 18}
+        for token_name in list(tokens):
+            try:
+                decimals[token_name] = await TokenRegistry.get_decimals(chain_name=chain_name, token_name=token_name)
+            except Exception as err:
+                logger.warning(f'[-] Portfolio | {token_name} in {chain_name.title()} is skipped: {err}')
+                del tokens[token_name]
+
+        calls = {}
+        for address in addresses:
+            calls[(address, "ETH")] = {"contract": multicall_contract, "func": "getEthBalance", "args": [address]}
+            for token_name, contract in tokens.items():
+                calls[(address, token_name)] = {"contract": contract, "func": "balanceOf", "args": [address]}
+
+        balances = {}
+        for (address, token_name), value in (await MultiCall.call(chain_name=chain_name, call_data=calls)).items():
+            balances.setdefault(address, {})[token_name] = value / 10 ** decimals[token_name]
+        return balances
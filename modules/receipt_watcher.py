@@ -0,0 +1,73 @@
+from web3.exceptions import TransactionNotFound, TimeExhausted
+from loguru import logger
+from time import monotonic
+import asyncio
+
+from modules.rpc_initializer import RPCInitializer
+from modules.chain_service import ChainService
+import modules.config as config
+import settings
+
+
+class ReceiptWatcher(ChainService):
+    """
+    One watcher task per chain polls receipts of every pending tx once per block time.
+    Polls of one round are gathered on sticky web3 of watcher, so they go to one rpc, as one
+    JSON-RPC batch when `RPC_BATCH` is enabled.
+    Waiters get receipt from shared future, `TO_WAIT_TX` timeout is checked by watcher.
+    """
+
+    @classmethod
+    def _create_state(cls, chain_name: str):
+        return {
+            "interval": config.get_block_time(chain_name),
+            "web3": RPCInitializer.create_web3(chain_name, sticky=True),
+            "pending": {},              # tx_hash: {"future": asyncio.Future, "deadline": float, "timeout": float}
+            "watcher": None,
+        }
+
+
+    @classmethod
+    async def wait(cls, chain_name: str, tx_hash: str, timeout: float = None):
+        """Returns receipt of tx, raises `TimeExhausted` if tx is not mined in `timeout` seconds"""
+        if timeout is None:
+            timeout = settings.TO_WAIT_TX * 60
+        state = cls._get_state(chain_name)
+
+        waiter = state["pending"].get(tx_hash)
+        if waiter is None:
+            waiter = state["pending"][tx_hash] = {"future": state["loop"].create_future(), "deadline": 0.0, "timeout": timeout}
+        waiter["deadline"] = max(waiter["deadline"], monotonic() + timeout)
+
+        if state["watcher"] is None or state["watcher"].done():
+            state["watcher"] = asyncio.ensure_future(cls._watch(chain_name, state))
+
+        return await asyncio.shield(waiter["future"])
+
+
+    @classmethod
+    async def _watch(cls, chain_name: str, state: dict):
+        web3 = state["web3"]
+        while state["pending"]:
+            await asyncio.sleep(state["interval"])
+
+            tx_hashes = list(state["pending"])
+            receipts = await asyncio.gather(*[
+                web3.eth.get_transaction_receipt(tx_hash)
+                for tx_hash in tx_hashes
+            ], return_exceptions=True)
+
+            now = monotonic()
+            for tx_hash, receipt in zip(tx_hashes, receipts):
+                waiter = state["pending"][tx_hash]
+                if not isinstance(receipt, Exception):
+                    waiter["future"].set_result(receipt)
+                elif now >= waiter["deadline"]:
+                    waiter["future"].set_exception(TimeExhausted(
+                        f"Transaction {tx_hash} is not in the chain after {waiter['timeout']} seconds"
+                    ))
+                else:
+                    if not isinstance(receipt, TransactionNotFound):
+                        logger.debug(f'[•] Web3 | {chain_name.title()} receipt of {tx_hash} error: {receipt}')
+                    continue
+                del state["pending"][tx_hash]
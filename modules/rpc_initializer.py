@@ -1,16 +1,19 @@
 from web3.middleware import async_geth_poa_middleware
 from eth_typing.evm import Address
-from web3 import Web3, AsyncWeb3
+from web3 import AsyncWeb3
 from web3.auto import w3
-from random import choice
 
-from settings import RPCS
+from modules.rpc_pool import RPCEndpoint, RPCPool, PooledProvider, SessionPool, SharedSessionProvider
+from settings import RPCS, RPC_BATCH
 
 
 class RPCInitializer:
-    connector_list: dict = {}
+    connector_list: dict = {}   # connector_type: {chain: [RPCEndpoint]}
+    pools: dict = {}            # chain: RPCPool
+    shared_web3: dict = {}      # chain: AsyncWeb3 balanced over all endpoints of chain
 
-    def __init__(self, proxies: list | None):
+    def __init__(self, proxies: list | None, batch_requests: bool = RPC_BATCH):
+        SharedSessionProvider.batch_requests = batch_requests
         if not self.connector_list:
             self.initialize_rpcs(proxies)
 
@@ -18,40 +21,37 @@ class RPCInitializer:
     def initialize_rpcs(self, proxies: list | None):
         if self.connector_list: return
 
-        if proxies:
-            self.connector_list["default"] = {
-                chain: [
-                    AsyncWeb3(Web3.AsyncHTTPProvider(
-                        rpc,
-                        request_kwargs={"proxy": proxy},
-                    ))
-                    for proxy in proxies
-                    for rpc in RPCS[chain]
-                ]
-                for chain in RPCS
-            }
-
-        else:
-            for connector_type, rpc_list in [
-                ["default", RPCS],
-            ]:
-                self.connector_list[connector_type] = {
-                    chain: [
-                        AsyncWeb3(Web3.AsyncHTTPProvider(rpc))
-                        for rpc in rpc_list[chain]
-                    ]
-                    for chain in rpc_list
-                }
-
-        for connector_type in self.connector_list:
-            for chain in self.connector_list[connector_type]:
-                for web3 in self.connector_list[connector_type][chain]:
-                    web3.middleware_onion.inject(async_geth_poa_middleware, layer=0)
+        # providers are created on first request, see `ProviderCache`
+        self.connector_list["default"] = {
+            chain: [
+                RPCEndpoint(chain_name=chain, rpc=rpc, proxy=proxy)
+                for proxy in (proxies or [None])
+                for rpc in RPCS[chain]
+            ]
+            for chain in RPCS
+        }
+
+        for chain, endpoints in self.connector_list["default"].items():
+            self.pools[chain] = RPCPool(chain_name=chain, endpoints=endpoints)
+            self.shared_web3[chain] = self.create_web3(chain_name=chain)
+
+
+    @classmethod
+    def create_web3(cls, chain_name: str, sticky: bool = False):
+        """sticky: web3 keeps using one rpc until it fails, for requests of single wallet"""
+        web3 = AsyncWeb3(PooledProvider(pool=cls.pools[chain_name], sticky=sticky))
+        web3.middleware_onion.inject(async_geth_poa_middleware, layer=0)
+        return web3
+
+
+    @classmethod
+    async def close(cls):
+        await SessionPool.close_all()
 
 
     @classmethod
     def get_rpc(cls, chain_name: str):
-        return choice(cls.connector_list["default"][chain_name])
+        return cls.shared_web3[chain_name]
 
 
     @classmethod
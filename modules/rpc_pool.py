@@ -0,0 +1,369 @@
+from aiohttp import ClientSession, ClientTimeout, TCPConnector, ClientConnectorError, ClientResponseError
+from web3.providers.async_base import AsyncBaseProvider
+from collections import OrderedDict
+from urllib.parse import urlparse
+from random import choice
+from loguru import logger
+from time import monotonic
+from web3 import Web3
+from typing import Any
+import asyncio
+import json
+
+from settings import RPC_CONNECTIONS
+
+
+class SessionPool:
+    """
+    One keep-alive aiohttp session per (rpc host, proxy), shared by every wallet,
+    so warm connections are reused instead of new TLS handshake for every call
+    """
+
+    KEEPALIVE_TIMEOUT: float = 60
+    REQUEST_TIMEOUT: float = 30
+
+    sessions: dict = {}     # (host, proxy): (ClientSession, loop of session)
+    closing: set = set()    # sessions of evicted providers, closed after in-flight requests
+
+    @classmethod
+    def get_key(cls, rpc: str, proxy: str | None):
+        return urlparse(rpc).netloc, proxy
+
+
+    @classmethod
+    def get(cls, rpc: str, proxy: str | None):
+        key = cls.get_key(rpc, proxy)
+        loop = asyncio.get_running_loop()
+        session, session_loop = cls.sessions.get(key, (None, None))
+        if session is None or session.closed or session_loop is not loop:
+            session = ClientSession(
+                connector=TCPConnector(
+                    limit=RPC_CONNECTIONS,
+                    limit_per_host=RPC_CONNECTIONS,
+                    keepalive_timeout=cls.KEEPALIVE_TIMEOUT,
+                    ttl_dns_cache=300,
+                ),
+                timeout=ClientTimeout(total=cls.REQUEST_TIMEOUT),
+                raise_for_status=True,
+            )
+            cls.sessions[key] = (session, loop)
+        return session
+
+
+    @classmethod
+    def evict(cls, rpc: str, proxy: str | None):
+        """Drops session, it's closed after `REQUEST_TIMEOUT` so requests already sent can finish"""
+        session, session_loop = cls.sessions.pop(cls.get_key(rpc, proxy), (None, None))
+        if session is None or session.closed or session_loop is not asyncio.get_running_loop():
+            return
+
+        def close():
+            cls.closing.discard(session)
+            if not session.closed: asyncio.ensure_future(session.close())
+
+        cls.closing.add(session)
+        session_loop.call_later(cls.REQUEST_TIMEOUT, close)
+
+
+    @classmethod
+    async def close_all(cls):
+        sessions = [session for session, _ in cls.sessions.values()] + list(cls.closing)
+        cls.sessions, cls.closing = {}, set()
+        await asyncio.gather(*[session.close() for session in sessions if not session.closed])
+
+
+class SharedSessionProvider(Web3.AsyncHTTPProvider):
+    """
+    AsyncHTTPProvider which sends requests through shared session of `SessionPool`.
+    With `batch_requests` calls made within `BATCH_WINDOW` are sent as one JSON-RPC batch.
+    """
+
+    BATCH_WINDOW: float = 0.002     # seconds to collect calls, covers nested gathers of one tx
+    BATCH_SIZE: int = 20
+
+    batch_requests: bool = False
+
+    def __init__(self, rpc: str, proxy: str | None):
+        super().__init__(rpc)
+        self.proxy = proxy
+        self.pending = []           # [(method, params, future)] of next batch
+        self.sending = set()        # batches in flight, referenced until done
+
+
+    async def make_request(self, method: str, params: Any):
+        if not self.batch_requests:
+            return self.decode_rpc_response(await self._post(self.encode_rpc_request(method, params)))
+
+        future = asyncio.get_running_loop().create_future()
+        self.pending.append((method, params, future))
+        if len(self.pending) == 1:
+            asyncio.get_running_loop().call_later(self.BATCH_WINDOW, self._flush)
+        return await future
+
+
+    def _flush(self):
+        pending, self.pending = self.pending, []
+        for index in range(0, len(pending), self.BATCH_SIZE):
+            task = asyncio.ensure_future(self._send_batch(pending[index:index + self.BATCH_SIZE]))
+            self.sending.add(task)
+            task.add_done_callback(self.sending.discard)
+
+
+    async def _send_batch(self, batch: list):
+        try:
+            if len(batch) == 1:
+                method, params, future = batch[0]
+                responses = [self.decode_rpc_response(await self._post(self.encode_rpc_request(method, params)))]
+            else:
+                requests = [self.encode_rpc_request(method, params) for method, params, _ in batch]
+                responses = self.decode_rpc_response(await self._post(b'[' + b','.join(requests) + b']'))
+                if not isinstance(responses, list):
+                    # rpc doesn't support batches, send requests one by one
+                    responses = [
+                        self.decode_rpc_response(raw_response)
+                        for raw_response in await asyncio.gather(*[self._post(request) for request in requests])
+                    ]
+                responses_by_id = {response.get("id"): response for response in responses}
+                responses = [responses_by_id.get(json.loads(request)["id"]) for request in requests]
+
+        except Exception as err:
+            for _, _, future in batch:
+                if not future.done(): future.set_exception(err)
+            return
+
+        for (method, _, future), response in zip(batch, responses):
+            if future.done(): continue
+            if response is None: future.set_exception(ValueError(f'No response for {method} in batch'))
+            else: future.set_result(response)
+
+
+    async def _post(self, request_data: bytes):
+        session = SessionPool.get(rpc=self.endpoint_uri, proxy=self.proxy)
+        async with session.post(
+                self.endpoint_uri,
+                data=request_data,
+                proxy=self.proxy,
+                headers=self.get_request_headers(),
+        ) as response:
+            return await response.read()
+
+
+class ProviderCache:
+    """
+    Http providers created on first use per (chain, rpc, proxy). Least recently
+    used providers are dropped above `MAX_SIZE`, or after `IDLE_TTL` seconds unused,
+    together with their session when no other cached provider uses it.
+    """
+
+    MAX_SIZE: int = 256
+    IDLE_TTL: float = 600
+
+    providers: OrderedDict = OrderedDict()  # (chain, rpc, proxy): (provider, last used time)
+
+    @classmethod
+    def get(cls, chain_name: str, rpc: str, proxy: str | None):
+        now = monotonic()
+        key = (chain_name, rpc, proxy)
+        if key in cls.providers:
+            provider = cls.providers.pop(key)[0]
+        else:
+            provider = SharedSessionProvider(rpc=rpc, proxy=proxy)
+
+        while cls.providers and (
+                len(cls.providers) >= cls.MAX_SIZE or
+                next(iter(cls.providers.values()))[1] < now - cls.IDLE_TTL
+        ):
+            (_, evicted_rpc, evicted_proxy), _ = cls.providers.popitem(last=False)
+            session_key = SessionPool.get_key(evicted_rpc, evicted_proxy)
+            if not any(SessionPool.get_key(cached_rpc, cached_proxy) == session_key for _, cached_rpc, cached_proxy in [*cls.providers, key]):
+                SessionPool.evict(evicted_rpc, evicted_proxy)
+        cls.providers[key] = (provider, now)
+        return provider
+
+
+class RPCEndpoint:
+    """Health of one (rpc, proxy) pair: EWMA latency, EWMA error rate and circuit breaker. Provider is created lazily"""
+
+    LATENCY_ALPHA: float = 0.3
+    ERROR_ALPHA: float = 0.2
+    ERROR_PENALTY: float = 10           # score multiplier of 100% error rate
+    BREAKER_FAILURES: int = 3           # consecutive failures to open circuit
+    BREAKER_COOLDOWN: float = 30        # seconds, doubled on every failed trial, up to `BREAKER_MAX_COOLDOWN`
+    BREAKER_MAX_COOLDOWN: float = 300
+
+    def __init__(self, chain_name: str, rpc: str, proxy: str | None):
+        self.chain_name = chain_name
+        self.rpc = rpc
+        self.proxy = proxy
+
+        self.latency = 0.5              # optimistic start, so new endpoints get requests
+        self.error_rate = 0.0
+        self.in_flight = 0
+        self.failures = 0
+        self.open_until = 0.0
+        self.cooldown = self.BREAKER_COOLDOWN
+        self.last_error = None          # failed http request of batch is reported by every call of it
+
+
+    @property
+    def provider(self):
+        return ProviderCache.get(chain_name=self.chain_name, rpc=self.rpc, proxy=self.proxy)
+
+
+    def is_available(self, now: float):
+        return now >= self.open_until
+
+
+    def score(self):
+        """Expected cost of request, lower is better"""
+        return self.latency * (1 + self.ERROR_PENALTY * self.error_rate) * (1 + self.in_flight)
+
+
+    def on_success(self, latency: float):
+        self.latency += self.LATENCY_ALPHA * (latency - self.latency)
+        self.error_rate -= self.ERROR_ALPHA * self.error_rate
+        self.failures = 0
+        self.cooldown = self.BREAKER_COOLDOWN
+
+
+    def on_failure(self, latency: float, error: Exception | str):
+        if isinstance(error, Exception):
+            if error is self.last_error: return
+            self.last_error = error
+        self.latency += self.LATENCY_ALPHA * (max(latency, self.latency) - self.latency)
+        self.error_rate += self.ERROR_ALPHA * (1 - self.error_rate)
+        self.failures += 1
+
+        if self.failures >= self.BREAKER_FAILURES and self.is_available(monotonic()):
+            self.open_until = monotonic() + self.cooldown
+            logger.warning(f'[-] RPC | {self.rpc} is disabled for {int(self.cooldown)}s after {self.failures} fails: {error}')
+            self.cooldown = min(self.cooldown * 2, self.BREAKER_MAX_COOLDOWN)
+
+
+class RPCPool:
+    """Endpoints of one chain. Picks by power of two choices weighted by endpoint score"""
+
+    PICK_TRIES: int = 8     # random draws to find two available endpoints before scanning all of them
+
+    def __init__(self, chain_name: str, endpoints: list[RPCEndpoint]):
+        self.chain_name = chain_name
+        self.endpoints = endpoints
+
+
+    def pick(self, exclude: list = ()):
+        now = monotonic()
+        candidates = []
+        for _ in range(self.PICK_TRIES):
+            endpoint = choice(self.endpoints)
+            if endpoint not in exclude and endpoint not in candidates and endpoint.is_available(now):
+                candidates.append(endpoint)
+                if len(candidates) == 2: break
+
+        if len(candidates) < 2:
+            candidates = [endpoint for endpoint in self.endpoints if endpoint not in exclude and endpoint.is_available(now)]
+        if not candidates:
+            # every circuit is open: trial the one which is closest to be available again
+            candidates = [endpoint for endpoint in self.endpoints if endpoint not in exclude]
+            if not candidates: return None
+            return min(candidates, key=lambda endpoint: endpoint.open_until)
+
+        if len(candidates) > 2:
+            candidates = [choice(candidates), choice(candidates)]
+        return min(candidates, key=RPCEndpoint.score)
+
+
+    def get_stats(self):
+        return [
+            {
+                "rpc": endpoint.rpc,
+                "proxy": endpoint.proxy,
+                "latency_ms": round(endpoint.latency * 1000),
+                "error_rate": round(endpoint.error_rate, 3),
+                "available": endpoint.is_available(monotonic()),
+            }
+            for endpoint in self.endpoints
+        ]
+
+
+class PooledProvider(AsyncBaseProvider):
+    """
+    Provider which sends every request through endpoint of `RPCPool` and fails
+    over to other endpoint on transport errors and rate limits. When `sticky`,
+    keeps the same endpoint until it fails, like single-rpc provider did.
+    """
+
+    MAX_ATTEMPTS: int = 3
+    RATE_LIMIT_CODES: tuple = (-32005, -32029, 429)
+    RETRY_STATUSES: tuple = (429, 503)  # http statuses of requests which were not processed
+    NON_IDEMPOTENT_METHODS: tuple = ("eth_sendRawTransaction", "eth_sendTransaction")
+
+    def __init__(self, pool: RPCPool, sticky: bool = False):
+        super().__init__()
+        self.pool = pool
+        self.sticky = sticky
+        self.endpoint = None
+
+
+    @property
+    def endpoint_uri(self):
+        return self.endpoint.rpc if self.endpoint else None
+
+
+    async def make_request(self, method: str, params: Any):
+        tried = []
+        while True:
+            endpoint = self._get_endpoint(tried)
+            tried.append(endpoint)
+
+            endpoint.in_flight += 1
+            started_at = monotonic()
+            try:
+                response = await endpoint.provider.make_request(method, params)
+                error = self._get_rate_limit_error(response)
+            except Exception as err:
+                response, error = None, err
+            finally:
+                endpoint.in_flight -= 1
+
+            if error is None:
+                endpoint.on_success(monotonic() - started_at)
+                return response
+
+            endpoint.on_failure(monotonic() - started_at, error)
+            if self.endpoint is endpoint: self.endpoint = None
+            if len(tried) >= min(self.MAX_ATTEMPTS, len(self.pool.endpoints)) or not self._can_retry(method, response, error):
+                if response is not None: return response
+                raise error
+            logger.debug(f'[•] RPC | {self.pool.chain_name.title()} {method} failed on {endpoint.rpc}, trying another rpc: {error}')
+
+
+    async def is_connected(self, show_traceback: bool = False):
+        return any(endpoint.is_available(monotonic()) for endpoint in self.pool.endpoints)
+
+
+    def _get_endpoint(self, tried: list):
+        if self.sticky and self.endpoint is not None and self.endpoint.is_available(monotonic()):
+            return self.endpoint
+
+        self.endpoint = self.pool.pick(exclude=tried)  # kept for sticky requests and for logs
+        return self.endpoint
+
+
+    def _can_retry(self, method: str, response: dict | None, error: Exception | str):
+        """
+        Timeout or transport error doesn't tell if tx was accepted, so sending txs is retried
+        on other rpc only when request surely wasn't processed: rate limit, unavailable rpc or connection refused
+        """
+        if method not in self.NON_IDEMPOTENT_METHODS:
+            return True
+        if isinstance(error, ClientResponseError):
+            return error.status in self.RETRY_STATUSES
+        return response is not None or isinstance(error, ClientConnectorError)
+
+
+    def _get_rate_limit_error(self, response: dict):
+        error = response.get("error") if isinstance(response, dict) else None
+        if not isinstance(error, dict): return None
+        if error.get("code") in self.RATE_LIMIT_CODES or "rate limit" in str(error.get("message", "")).lower():
+            return error.get("message") or str(error)
+        return None
@@ -0,0 +1,80 @@
+from json import loads
+
+
+class RSCResponse:
+    """
+    React Server Components response of server action. Rows (`<id>:<json>\n` or
+    length-prefixed text `<id>:T<hex length>,<text>`) are indexed by id in one pass
+    as spans of response bytes and decoded only when requested.
+    """
+
+    def __init__(self, content: bytes | str):
+        self.content = content.encode() if isinstance(content, str) else content
+        self.rows = {}          # row_id: (is_text, start, end)
+        self.decoded = {}       # row_id: decoded row
+
+        content, position, length = self.content, 0, len(self.content)
+        while position < length:
+            colon = content.find(b":", position)
+            if colon == -1: break
+            row_id = content[position:colon].strip().decode()
+
+            if content.startswith(b"T", colon + 1) and (comma := content.find(b",", colon + 2)) != -1:
+                start = comma + 1
+                end = start + int(content[colon + 2:comma], 16)
+                self.rows.setdefault(row_id, (True, start, end))
+                position = end
+            else:
+                end = content.find(b"\n", colon + 1)
+                if end == -1: end = length
+                self.rows.setdefault(row_id, (False, colon + 1, end))
+                position = end + 1
+
+
+    def get_json(self, row_id: str):
+        """Row decoded as json object, None if there is no such json row"""
+        if row_id not in self.decoded:
+            is_text, start, end = self.rows.get(row_id, (True, 0, 0))
+            is_object = not is_text and self.content.startswith(b"{", start) and self.content.endswith(b"}", start, end)
+            self.decoded[row_id] = loads(self.content[start:end]) if is_object else None
+        return self.decoded[row_id]
+
+
+    def get_text(self, row_id: str):
+        """Text row, None if there is no such text row"""
+        is_text, start, end = self.rows.get(row_id, (False, 0, 0))
+        return self.content[start:end].decode() if is_text else None
+
+
+class PipelineResponse(RSCResponse):
+    """Elsa pipeline server action response: result in row 1, signed tx data in text row 2"""
+
+    @property
+    def result(self) -> dict | None:
+        return self.get_json("1")
+
+
+    @property
+    def status(self) -> int | None:
+        return (self.result or {}).get("status")
+
+
+    @property
+    def pipeline_id(self) -> str | None:
+        if self.status != 200: return None
+        return ((self.result or {}).get("data") or {}).get("pipeline_id")
+
+
+    @property
+    def actions(self) -> list:
+        data = (self.result or {}).get("data")
+        return data if isinstance(data, list) else []
+
+
+    def get_action(self, action_type: str) -> dict | None:
+        return next((action for action in self.actions if action.get("action_type") == action_type), None)
+
+
+    @property
+    def tx_data(self) -> str | None:
+        return self.get_text("2")
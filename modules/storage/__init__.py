@@ -0,0 +1,7 @@
+from .json_storage import JsonStorage
+from .sqlite_storage import SqliteStorage
+from .modules_index import ModulesIndex
+from .ref_codes_pool import RefCodesPool
+from .migrator import migrate_json_to_sqlite
+from .writer import StorageWriter
+from .scheduler import WalletScheduler
@@ -0,0 +1,129 @@
+from os import path, replace, fsync, truncate
+from typing import Iterable
+import json
+
+from .report_log import ReportLog
+
+
+class JsonStorage:
+    COMPACT_EVERY: int = 5000    # rewrite snapshot after this amount of journal operations
+
+    def __init__(self, modules_path: str, report_path: str, refs_path: str):
+        self.modules_path = modules_path
+        self.journal_path = modules_path.removesuffix('.json') + '.journal'
+        self.report_path = report_path
+        self.refs_path = refs_path
+        self.refs_journal_path = refs_path.removesuffix('.json') + '.journal'
+
+        for db_path, db_value in [
+            [self.modules_path, "[]"],
+            [self.report_path, "{}"],
+            [self.refs_path, "[]"],
+        ]:
+            if not path.isfile(db_path):
+                with open(db_path, 'w') as f: f.write(db_value)
+
+        self.journal = open(self.journal_path, 'a', encoding="utf-8")
+        self.refs_journal = open(self.refs_journal_path, 'a', encoding="utf-8")
+
+        self.reports = ReportLog(log_path=self.report_path.removesuffix('.json') + '.jsonl')
+        legacy_reports = self._load(self.report_path)
+        if legacy_reports:
+            self.reports.import_reports(legacy_reports)
+            self._dump(self.report_path, {})
+
+
+    @staticmethod
+    def _load(file_path: str):
+        with open(file_path, encoding="utf-8") as f: return json.load(f)
+
+
+    @staticmethod
+    def _dump(file_path: str, data):
+        with open(file_path, 'w', encoding="utf-8") as f: json.dump(data, f)
+
+
+    @staticmethod
+    def read_journal(journal_path: str):
+        """Returns journal operations and size of fully written part of journal"""
+        ops = []
+        valid_size = 0
+        if not path.isfile(journal_path):
+            return ops, valid_size
+
+        with open(journal_path, 'rb') as f:
+            for line in f:
+                try:
+                    if not line.endswith(b'\n'): raise ValueError
+                    ops.append(json.loads(line))
+                    valid_size += len(line)
+                except ValueError:
+                    break  # last operation was not fully written before crash
+
+        return ops, valid_size
+
+
+    def load_modules(self):
+        """Returns snapshot and journal operations made after it"""
+        wallets = self._load(self.modules_path) or {}
+
+        ops, valid_size = self.read_journal(self.journal_path)
+        if valid_size != path.getsize(self.journal_path):
+            truncate(self.journal_path, valid_size)
+
+        return wallets, ops
+
+
+    def commit_batch(self, mutations: list):
+        """Writes batch of mutations and syncs changed files to disk once"""
+        changed_files = set()
+        for kind, payload in mutations:
+            match kind:
+                case "modules":
+                    self.journal.write(''.join(json.dumps(op) + '\n' for op in payload))
+                    changed_files.add(self.journal)
+                case "refs":
+                    self.refs_journal.write(''.join(json.dumps(op) + '\n' for op in payload))
+                    changed_files.add(self.refs_journal)
+                case "report":
+                    self.reports.append(*payload)
+                    changed_files.add(self.reports.log)
+                case _:
+                    raise ValueError(f'Unexpected mutation kind: {kind}')
+
+        for changed_file in changed_files:
+            changed_file.flush()
+            fsync(changed_file.fileno())
+
+
+    def write_modules(self, wallets_chunks: Iterable[dict], clear_reports: bool = True):
+        """Atomically rewrites snapshot from chunks of wallets and clears journal"""
+        if clear_reports:
+            self.reports.clear()  # clear report db
+
+        with open(self.modules_path + '.tmp', 'w', encoding="utf-8") as f:
+            separator = '{'
+            for wallets in wallets_chunks:
+                for encoded_pk, wallet_data in wallets.items():
+                    f.write(separator + json.dumps(encoded_pk) + ': ' + json.dumps(wallet_data))
+                    separator = ', '
+            f.write('}' if separator == ', ' else '{}')
+            f.flush()
+            fsync(f.fileno())
+        replace(self.modules_path + '.tmp', self.modules_path)
+
+        self.journal.close()
+        self.journal = open(self.journal_path, 'w', encoding="utf-8")
+
+
+    def load_refs(self):
+        """Returns ref codes snapshot and operations made after it"""
+        ops, valid_size = self.read_journal(self.refs_journal_path)
+        if valid_size != path.getsize(self.refs_journal_path):
+            truncate(self.refs_journal_path, valid_size)
+
+        return self._load(self.refs_path), ops
+
+
+    def get_reports(self, encoded_pk: str, consume: bool = True):
+        return self.reports.get(encoded_pk=encoded_pk, consume=consume)
@@ -0,0 +1,65 @@
+from loguru import logger
+from os import path
+import json
+
+from .sqlite_storage import SqliteStorage
+from .json_storage import JsonStorage
+from .modules_index import ModulesIndex
+from .ref_codes_pool import RefCodesPool
+from .report_log import ReportLog
+
+
+def migrate_json_to_sqlite(storage: SqliteStorage, modules_path: str, report_path: str, refs_path: str):
+    """
+    One-shot import of json databases (snapshots with their journals) into empty sqlite database.
+    Marker row is written after import, so json is not imported again when all wallets are deleted.
+    """
+    if storage.get_meta("json_migrated"):
+        return False
+    if not storage.is_empty():  # migrated before marker was added
+        storage.set_meta("json_migrated", "1")
+        return False
+
+    json_dbs = {}
+    for db_name, db_path in [
+        ["modules", modules_path],
+        ["reports", report_path],
+        ["refs", refs_path],
+    ]:
+        if path.isfile(db_path):
+            with open(db_path, encoding="utf-8") as f: json_dbs[db_name] = json.load(f) or None
+        else:
+            json_dbs[db_name] = None
+
+    modules_ops = JsonStorage.read_journal(modules_path.removesuffix('.json') + '.journal')[0]
+    if json_dbs["modules"] or modules_ops:
+        modules_index = ModulesIndex(max_token_hold=1, max_chains_hold=1)
+        modules_index.load(wallets=json_dbs["modules"] or {}, ops=modules_ops)
+        json_dbs["modules"] = modules_index.dump()
+
+    report_log_path = report_path.removesuffix('.json') + '.jsonl'
+    if path.isfile(report_log_path):
+        json_dbs["reports"] = {**(json_dbs["reports"] or {}), **ReportLog(log_path=report_log_path).get_all()}
+
+    refs_ops = JsonStorage.read_journal(refs_path.removesuffix('.json') + '.journal')[0]
+    if json_dbs["refs"] or refs_ops:
+        ref_codes_pool = RefCodesPool()
+        ref_codes_pool.load(refs=json_dbs["refs"] or [], ops=refs_ops)
+        json_dbs["refs"] = ref_codes_pool.dump()
+
+    if not any(json_dbs.values()):
+        return False
+
+    if json_dbs["modules"]:
+        storage.write_modules([json_dbs["modules"]], clear_reports=False)
+    if json_dbs["reports"]:
+        storage.insert_reports(json_dbs["reports"])
+    if json_dbs["refs"]:
+        storage.insert_refs(json_dbs["refs"])
+    storage.set_meta("json_migrated", "1")
+
+    logger.success(
+        f'[+] Database | Migrated {len(json_dbs["modules"] or {})} accounts, {len(json_dbs["reports"] or {})} reports '
+        f'and {len(json_dbs["refs"] or [])} ref codes from json to sqlite'
+    )
+    return True
@@ -0,0 +1,272 @@
+from collections import Counter
+from random import choice
+
+from .scheduler import WalletScheduler
+
+
+class ModulesIndex:
+    """
+    In-memory state of modules database, source of truth for every read.
+
+    Every mutation is expressed as journal operation (dict), applied to memory
+    and returned to be persisted by storage. Operations are idempotent, so
+    replaying journal over newer snapshot gives the same state.
+    """
+
+    def __init__(self, max_token_hold: int, max_chains_hold: int):
+        self.max_token_hold = max_token_hold
+        self.max_chains_hold = max_chains_hold
+
+        self.wallets = {}           # encoded_pk: {"address": str, "proxy": str, "modules": {module_id: module}}
+        self.by_status = {}         # status: {(encoded_pk, module_id)}
+        self.wallet_counts = {}     # encoded_pk: Counter({status: modules amount})
+        self.modules_amount = 0
+        self.last_module_id = 0
+
+        self.wallet_ready = {}      # encoded_pk: {module_id} - modules which can be picked right now
+        self.pending_reset = {}     # encoded_pk: {module_id} - failed modules reset in memory, but not on disk yet
+        self.scheduler = WalletScheduler()
+
+
+    def load(self, wallets: dict, ops: list = (), reset_failed: bool = False):
+        """
+        reset_failed: failed modules become `to_run` in memory only, their statuses
+        are written to disk lazily when wallet is claimed (see `pop_pending_reset`)
+        """
+        self.wallets = {}
+        self.by_status = {}
+        self.wallet_counts = {}
+        self.modules_amount = 0
+        self.wallet_ready = {}
+        self.pending_reset = {}
+        self.scheduler.clear()
+        self.last_module_id = max(
+            [module.get("id") or 0 for wallet_data in wallets.values() for module in wallet_data["modules"]],
+            default=0
+        )
+
+        self.add_wallets(wallets, refresh=False)
+
+        for op in ops:
+            self.apply(op, refresh=False)
+
+        if reset_failed:
+            for status in ["failed", "cloudflare", "underfunded"]:
+                for encoded_pk, module_id in list(self.by_status.get(status, [])):
+                    self._set_status(encoded_pk, module_id, "to_run")
+                    self.pending_reset.setdefault(encoded_pk, set()).add(module_id)
+
+        for encoded_pk in self.wallets:
+            self._refresh_wallet(encoded_pk)
+
+
+    def add_wallets(self, wallets: dict, refresh: bool = True):
+        for encoded_pk, wallet_data in wallets.items():
+            self.wallets[encoded_pk] = {
+                "address": wallet_data["address"],
+                "proxy": wallet_data.get("proxy"),
+                "modules": {},
+            }
+            self.wallet_counts[encoded_pk] = Counter()
+            for module in wallet_data["modules"]:
+                if module.get("id") is None:
+                    self.last_module_id += 1
+                    module["id"] = self.last_module_id
+                self._add_module(encoded_pk, module)
+            if refresh:
+                self._refresh_wallet(encoded_pk)
+
+
+    def dump(self):
+        return {
+            encoded_pk: {
+                "address": wallet_data["address"],
+                "modules": list(wallet_data["modules"].values()),
+                "proxy": wallet_data["proxy"],
+            }
+            for encoded_pk, wallet_data in self.wallets.items()
+        }
+
+
+    # --- journal operations ---
+
+    def apply(self, op: dict, refresh: bool = True):
+        encoded_pk = op.get("pk")
+        wallet_data = self.wallets.get(encoded_pk)
+
+        match op["op"]:
+            case "add":
+                self.last_module_id = max(self.last_module_id, op["module"]["id"])
+                if wallet_data is None or op["module"]["id"] in wallet_data["modules"]: return
+                self._add_module(encoded_pk, dict(op["module"]))
+
+            case "status":
+                if wallet_data is None or op["id"] not in wallet_data["modules"]: return
+                self._set_status(encoded_pk, op["id"], op["status"])
+                self.pending_reset.get(encoded_pk, set()).discard(op["id"])
+
+            case "del_module":
+                if wallet_data is None or op["id"] not in wallet_data["modules"]: return
+                self._count(encoded_pk, wallet_data["modules"].pop(op["id"]), -1)
+
+            case "del_wallet":
+                if wallet_data is None: return
+                for module in self.wallets.pop(encoded_pk)["modules"].values():
+                    self._count(encoded_pk, module, -1)
+                del self.wallet_counts[encoded_pk]
+                self.pending_reset.pop(encoded_pk, None)
+                self.wallet_ready.pop(encoded_pk, None)
+                self.scheduler.set_ready(encoded_pk, 0)
+                return
+
+            case _:
+                raise ValueError(f'Unexpected journal operation: {op}')
+
+        if refresh:
+            self._refresh_wallet(encoded_pk)
+
+
+    def _apply_all(self, ops: list):
+        for op in ops:
+            self.apply(op)
+        return ops
+
+
+    def add_module(self, encoded_pk: str, new_module: dict):
+        self.last_module_id += 1
+        return self._apply_all([
+            {"op": "add", "pk": encoded_pk, "module": {**new_module, "id": self.last_module_id}}
+        ])
+
+
+    def remove_module(self, encoded_pk: str, module_info: dict):
+        wallet_data = self.wallets.get(encoded_pk)
+        if wallet_data is None: return []
+
+        module_id = self.find_module_id(encoded_pk, module_info)
+        if module_id is None: return []
+
+        if module_info["status"] in [True, "completed"]:
+            if len(wallet_data["modules"]) == 1:
+                return self._apply_all([{"op": "del_wallet", "pk": encoded_pk}])
+            return self._apply_all([{"op": "del_module", "pk": encoded_pk, "id": module_id}])
+
+        return self._apply_all([{"op": "status", "pk": encoded_pk, "id": module_id, "status": "failed"}])
+
+
+    def remove_account(self, encoded_pk: str, completed: bool):
+        if encoded_pk not in self.wallets: return []
+        if completed:
+            return self._apply_all([{"op": "del_wallet", "pk": encoded_pk}])
+
+        return self._apply_all([
+            {"op": "status", "pk": encoded_pk, "id": module_id, "status": "failed"}
+            for module_id in self.wallets[encoded_pk]["modules"]
+        ])
+
+
+    def set_underfunded(self, encoded_pk: str, underfunded: bool):
+        """Underfunded wallet modules are not picked until next balances check or restart"""
+        if encoded_pk not in self.wallets: return []
+        old_status, new_status = ("to_run", "underfunded") if underfunded else ("underfunded", "to_run")
+        return self._apply_all([
+            {"op": "status", "pk": encoded_pk, "id": module_id, "status": new_status}
+            for module_id, module in self.wallets[encoded_pk]["modules"].items()
+            if module["status"] == old_status
+        ])
+
+
+    def pop_pending_reset(self, encoded_pk: str):
+        """Returns operations to persist statuses of wallet modules which were reset on load"""
+        return [
+            {"op": "status", "pk": encoded_pk, "id": module_id, "status": "to_run"}
+            for module_id in self.pending_reset.pop(encoded_pk, set())
+        ]
+
+
+    # --- reads ---
+
+    def find_module_id(self, encoded_pk: str, module_info: dict):
+        modules = self.wallets[encoded_pk]["modules"]
+        if module_info.get("id") is not None:
+            return module_info["id"] if module_info["id"] in modules else None
+
+        return next((
+            module_id for module_id, module in modules.items()
+            if module == {**module_info, "status": "to_run", "id": module_id}
+        ), None)
+
+
+    def get_wallet_modules_left(self, encoded_pk: str):
+        if encoded_pk not in self.wallet_counts: return 0
+        return self.wallet_counts[encoded_pk]["to_run"]
+
+
+    def get_amounts(self):
+        return len(self.wallets), self.modules_amount
+
+
+    def claim(self, randomly: bool = True):
+        """Returns ready (encoded_pk, module_id) of not claimed wallet and claims wallet until `release`"""
+        encoded_pk = self.scheduler.claim(randomly=randomly)
+        if encoded_pk is None: return None
+
+        ready = self.wallet_ready[encoded_pk]
+        return encoded_pk, choice(tuple(ready)) if randomly else min(ready)
+
+
+    def release(self, encoded_pk: str):
+        self.scheduler.release(encoded_pk)
+
+
+    # --- indexes ---
+
+    def _add_module(self, encoded_pk: str, module: dict):
+        self.wallets[encoded_pk]["modules"][module["id"]] = module
+        self._count(encoded_pk, module, 1)
+
+
+    def _set_status(self, encoded_pk: str, module_id: int, status: str):
+        module = self.wallets[encoded_pk]["modules"][module_id]
+        self._count(encoded_pk, module, -1)
+        module["status"] = status
+        self._count(encoded_pk, module, 1)
+
+
+    def _count(self, encoded_pk: str, module: dict, delta: int):
+        """Keeps status indexes and counters in sync, called on every module add (+1) and removal (-1)"""
+        if delta > 0: self.by_status.setdefault(module["status"], set()).add((encoded_pk, module["id"]))
+        else: self.by_status[module["status"]].discard((encoded_pk, module["id"]))
+        self.wallet_counts[encoded_pk][module["status"]] += delta
+        self.modules_amount += delta
+
+
+    def _refresh_wallet(self, encoded_pk: str):
+        wallet_data = self.wallets.get(encoded_pk)
+        new_ready = set() if wallet_data is None else self._get_wallet_ready(wallet_data["modules"].values())
+
+        if new_ready: self.wallet_ready[encoded_pk] = new_ready
+        else: self.wallet_ready.pop(encoded_pk, None)
+        self.scheduler.set_ready(encoded_pk, len(new_ready))
+
+
+    def _get_wallet_ready(self, modules):
+        to_run_modules = [module for module in modules if module["status"] == "to_run"]
+        sell_modules = [
+            module["id"] for module in to_run_modules
+            if module["advance_info"] and module["module_name"] == "swap"
+        ]
+        back_bridge_modules = [
+            module["id"] for module in to_run_modules
+            if module["advance_info"] and module["module_name"] == "bridge"
+        ]
+
+        wallet_modules = []
+        if len(back_bridge_modules) >= self.max_chains_hold:
+            wallet_modules += back_bridge_modules
+        if len(sell_modules) >= self.max_token_hold:
+            wallet_modules += sell_modules
+        if not wallet_modules:
+            wallet_modules = [module["id"] for module in to_run_modules]
+
+        return set(wallet_modules)
@@ -0,0 +1,74 @@
+from collections import deque
+from random import choice
+
+
+class RefCodesPool:
+    """
+    In-memory referral codes: owner index and queue of free codes.
+    Mutations are returned as operations to be persisted by storage.
+    """
+
+    def __init__(self):
+        self.codes = {}         # owner: code
+        self.used = set()       # owners whose codes were given away
+        self.free = deque()     # owners in order of adding, used ones are skipped lazily
+        self.all_codes = []
+
+
+    def load(self, refs: list, ops: list = ()):
+        self.codes = {}
+        self.used = set()
+        self.free = deque()
+        self.all_codes = []
+
+        for ref_data in refs:
+            self.apply({"op": "add_ref", "owner": ref_data["owner"], "code": ref_data["code"]})
+            if ref_data["used"]:
+                self.apply({"op": "use_ref", "owner": ref_data["owner"]})
+        for op in ops:
+            self.apply(op)
+
+
+    def dump(self):
+        return [
+            {"owner": owner, "code": code, "used": owner in self.used}
+            for owner, code in self.codes.items()
+        ]
+
+
+    def apply(self, op: dict):
+        match op["op"]:
+            case "add_ref":
+                if op["owner"] in self.codes: return
+                self.codes[op["owner"]] = op["code"]
+                self.free.append(op["owner"])
+                self.all_codes.append(op["code"])
+
+            case "use_ref":
+                self.used.add(op["owner"])
+
+            case _:
+                raise ValueError(f'Unexpected ref codes operation: {op}')
+
+
+    def add_ref_code(self, address: str, code: str):
+        if address in self.codes: return []
+        op = {"op": "add_ref", "owner": address, "code": code}
+        self.apply(op)
+        return [op]
+
+
+    def get_ref_code(self, address: str, use_ref: bool):
+        """Returns ref code for new account and operations to persist"""
+        if address in self.codes or not self.codes or not use_ref:
+            return "", []
+
+        while self.free:
+            owner = self.free.popleft()
+            if owner in self.used: continue
+
+            op = {"op": "use_ref", "owner": owner}
+            self.apply(op)
+            return self.codes[owner], [op]
+
+        return choice(self.all_codes), [] # if no free ref codes left
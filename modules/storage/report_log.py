@@ -0,0 +1,101 @@
+from os import path, truncate
+import json
+
+
+class ReportLog:
+    """
+    Append-only reports file. Every line is report record or consumption mark
+    of account. Offsets of not consumed records are kept in memory per account,
+    so reading account reports never touches records of other accounts.
+    """
+
+    def __init__(self, log_path: str):
+        self.log_path = log_path
+        self.offsets = {}  # encoded_pk: [(offset, size)] of not consumed records
+
+        if not path.isfile(self.log_path):
+            with open(self.log_path, 'wb'): pass
+
+        valid_size = 0
+        with open(self.log_path, 'rb') as f:
+            for line in f:
+                try:
+                    if not line.endswith(b'\n'): raise ValueError
+                    record = json.loads(line)
+                except ValueError:
+                    break  # last record was not fully written before crash
+
+                if record.get("consumed"):
+                    self.offsets.pop(record["pk"], None)
+                else:
+                    self.offsets.setdefault(record["pk"], []).append((valid_size, len(line)))
+                valid_size += len(line)
+
+        if not self.offsets:
+            valid_size = 0  # all reports were consumed, start new log
+        if valid_size != path.getsize(self.log_path):
+            truncate(self.log_path, valid_size)
+
+        self.size = valid_size
+        self.log = open(self.log_path, 'ab')
+        self.reader = open(self.log_path, 'rb')
+
+
+    def _write(self, record: dict):
+        """Buffered write, caller is responsible to flush log"""
+        line = json.dumps(record).encode() + b'\n'
+        offset = self.size
+        self.log.write(line)
+        self.size += len(line)
+        return offset, len(line)
+
+
+    def append(self, encoded_pk: str, text: str, success: bool | None):
+        self.offsets.setdefault(encoded_pk, []).append(
+            self._write({"pk": encoded_pk, "text": text, "success": success})
+        )
+
+
+    def get(self, encoded_pk: str, consume: bool = True):
+        """Returns reports in `report.json` format: {"texts": [str], "success_rate": [succeeded, total]}"""
+        if not self.offsets.get(encoded_pk):
+            return None
+
+        self.log.flush()
+        records = []
+        for offset, size in self.offsets[encoded_pk]:
+            self.reader.seek(offset)
+            records.append(json.loads(self.reader.read(size)))
+
+        if consume:
+            self._write({"pk": encoded_pk, "consumed": True})
+            self.log.flush()
+            del self.offsets[encoded_pk]
+
+        return {
+            "texts": [record["text"] for record in records],
+            "success_rate": [
+                len([record for record in records if record["success"] is True]),
+                len([record for record in records if record["success"] is not None]),
+            ]
+        }
+
+
+    def get_all(self):
+        return {encoded_pk: self.get(encoded_pk, consume=False) for encoded_pk in self.offsets}
+
+
+    def import_reports(self, reports: dict):
+        """Imports reports in `report.json` format. Success rate is kept, but not bound to the exact texts"""
+        for encoded_pk, account_reports in reports.items():
+            succeeded, total = account_reports["success_rate"]
+            for index, text in enumerate(account_reports["texts"]):
+                self.append(encoded_pk, text, True if index < succeeded else False if index < total else None)
+        self.log.flush()
+
+
+    def clear(self):
+        self.log.flush()
+        self.log.truncate(0)
+        self.size = 0
+        self.offsets = {}
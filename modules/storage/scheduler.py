@@ -0,0 +1,100 @@
+from random import randrange
+
+
+class WalletScheduler:
+    """
+    Picks wallets to run. Every wallet is weighted by amount of its ready
+    modules, so random pick keeps the same distribution as uniform pick among
+    all ready modules. Claimed wallets have zero weight until released.
+    Weights are kept in Fenwick tree: pick, claim and release are O(log n).
+    """
+
+    def __init__(self):
+        self.slots = {}         # encoded_pk: slot index, slots are given in order of wallets adding
+        self.wallets = []       # slot: encoded_pk
+        self.ready = []         # slot: ready modules amount
+        self.claimed = set()    # encoded_pk
+        self.tree = [0]         # 1-based fenwick tree of weights
+        self.total = 0
+
+
+    def clear(self):
+        self.__init__()
+
+
+    def set_ready(self, encoded_pk: str, ready_amount: int):
+        """Called by modules index on every change of wallet ready modules"""
+        slot = self.slots.get(encoded_pk)
+        if slot is None:
+            if not ready_amount: return
+            slot = self._new_slot(encoded_pk)
+
+        old_weight = self._weight(slot)
+        self.ready[slot] = ready_amount
+        self._update(slot, self._weight(slot) - old_weight)
+
+
+    def claim(self, randomly: bool = True):
+        """Returns not claimed wallet with ready modules and claims it, or None"""
+        if not self.total: return None
+
+        slot = self._find(randrange(self.total) if randomly else 0)
+        encoded_pk = self.wallets[slot]
+        self._update(slot, -self._weight(slot))
+        self.claimed.add(encoded_pk)
+        return encoded_pk
+
+
+    def release(self, encoded_pk: str):
+        if encoded_pk not in self.claimed: return
+        self.claimed.discard(encoded_pk)
+        slot = self.slots[encoded_pk]
+        self._update(slot, self._weight(slot))
+
+
+    def _weight(self, slot: int):
+        return 0 if self.wallets[slot] in self.claimed else self.ready[slot]
+
+
+    def _new_slot(self, encoded_pk: str):
+        slot = len(self.wallets)
+        self.slots[encoded_pk] = slot
+        self.wallets.append(encoded_pk)
+        self.ready.append(0)
+
+        if slot + 1 >= len(self.tree):
+            self._rebuild(capacity=max(16, 2 * len(self.tree)))
+        return slot
+
+
+    def _rebuild(self, capacity: int):
+        self.tree = [0] * (capacity + 1)
+        for index in range(1, capacity + 1):
+            if index <= len(self.wallets):
+                self.tree[index] += self._weight(index - 1)
+            parent = index + (index & -index)
+            if parent <= capacity:
+                self.tree[parent] += self.tree[index]
+
+
+    def _update(self, slot: int, delta: int):
+        if not delta: return
+        self.total += delta
+        tree, size = self.tree, len(self.tree)
+        index = slot + 1
+        while index < size:
+            tree[index] += delta
+            index += index & -index
+
+
+    def _find(self, value: int):
+        """Returns first slot where prefix sum of weights exceeds `value`"""
+        tree, capacity = self.tree, len(self.tree) - 1
+        position = 0
+        step = 1 << (capacity.bit_length() - 1)
+        while step:
+            if position + step <= capacity and tree[position + step] <= value:
+                position += step
+                value -= tree[position]
+            step >>= 1
+        return position
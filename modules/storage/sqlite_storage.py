@@ -0,0 +1,226 @@
+from typing import Iterable
+import sqlite3
+import json
+
+
+class SqliteStorage:
+    COMPACT_EVERY: int = 0      # sqlite has its own journal, no snapshots compaction
+    SCHEMA: str = """
+        CREATE TABLE IF NOT EXISTS wallets (
+            id              INTEGER PRIMARY KEY,
+            encoded_pk      TEXT NOT NULL UNIQUE,
+            address         TEXT NOT NULL,
+            proxy           TEXT
+        );
+        CREATE TABLE IF NOT EXISTS modules (
+            id              INTEGER PRIMARY KEY,
+            wallet_id       INTEGER NOT NULL REFERENCES wallets(id) ON DELETE CASCADE,
+            module_name     TEXT NOT NULL,
+            status          TEXT NOT NULL,
+            advance_info    TEXT NOT NULL DEFAULT '{}'
+        );
+        CREATE INDEX IF NOT EXISTS modules_wallet_status ON modules(wallet_id, status);
+        CREATE INDEX IF NOT EXISTS modules_status ON modules(status);
+        CREATE TABLE IF NOT EXISTS reports (
+            id              INTEGER PRIMARY KEY,
+            encoded_pk      TEXT NOT NULL,
+            text            TEXT NOT NULL,
+            success         INTEGER
+        );
+        CREATE INDEX IF NOT EXISTS reports_encoded_pk ON reports(encoded_pk);
+        CREATE TABLE IF NOT EXISTS refcodes (
+            id              INTEGER PRIMARY KEY,
+            owner           TEXT NOT NULL UNIQUE,
+            code            TEXT NOT NULL,
+            used            INTEGER NOT NULL DEFAULT 0
+        );
+        CREATE INDEX IF NOT EXISTS refcodes_used ON refcodes(used);
+        CREATE TABLE IF NOT EXISTS meta (
+            key             TEXT PRIMARY KEY,
+            value           TEXT NOT NULL
+        );
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=FULL")      # commits survive power loss, as fsynced json journal
+        self.conn.execute("PRAGMA foreign_keys=ON")
+        self.conn.executescript(self.SCHEMA)
+        self.conn.commit()
+
+
+    def is_empty(self):
+        return not any(
+            self.conn.execute(f"SELECT 1 FROM {table} LIMIT 1").fetchone()
+            for table in ["wallets", "reports", "refcodes"]
+        )
+
+
+    def get_meta(self, key: str):
+        row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+
+    def set_meta(self, key: str, value: str):
+        with self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+
+    def _insert_wallets(self, wallets: dict):
+        for encoded_pk, wallet_data in wallets.items():
+            wallet_id = self.conn.execute(
+                "INSERT INTO wallets (encoded_pk, address, proxy) VALUES (?, ?, ?)",
+                (encoded_pk, wallet_data["address"], wallet_data.get("proxy"))
+            ).lastrowid
+            self.conn.executemany(
+                "INSERT INTO modules (id, wallet_id, module_name, status, advance_info) VALUES (?, ?, ?, ?, ?)",
+                [
+                    (module.get("id"), wallet_id, module["module_name"], module["status"], json.dumps(module["advance_info"]))
+                    for module in wallet_data["modules"]
+                ]
+            )
+
+
+    def load_modules(self):
+        """Returns all wallets with modules, sqlite has its own journal so no operations to replay"""
+        wallets = {
+            wallet_id: {
+                "encoded_pk": encoded_pk,
+                "address": address,
+                "modules": [],
+                "proxy": proxy,
+            }
+            for wallet_id, encoded_pk, address, proxy
+            in self.conn.execute("SELECT id, encoded_pk, address, proxy FROM wallets ORDER BY id")
+        }
+        for module_id, wallet_id, module_name, status, advance_info in self.conn.execute(
+            "SELECT id, wallet_id, module_name, status, advance_info FROM modules ORDER BY id"
+        ):
+            wallets[wallet_id]["modules"].append({
+                "module_name": module_name,
+                "status": status,
+                "advance_info": json.loads(advance_info),
+                "id": module_id,
+            })
+
+        return {
+            wallet_data.pop("encoded_pk"): wallet_data
+            for wallet_data in wallets.values()
+        }, []
+
+
+    def commit_batch(self, mutations: list):
+        """Writes batch of mutations in one transaction"""
+        with self.conn:
+            for kind, payload in mutations:
+                match kind:
+                    case "modules":
+                        self._apply_ops(payload)
+                    case "refs":
+                        self._apply_ref_ops(payload)
+                    case "report":
+                        encoded_pk, text, success = payload
+                        self.conn.execute(
+                            "INSERT INTO reports (encoded_pk, text, success) VALUES (?, ?, ?)",
+                            (encoded_pk, text, None if success is None else int(success))
+                        )
+                    case _:
+                        raise ValueError(f'Unexpected mutation kind: {kind}')
+
+
+    def _apply_ops(self, ops: list):
+        for op in ops:
+            match op["op"]:
+                case "add":
+                    self.conn.execute(
+                        "INSERT OR IGNORE INTO modules (id, wallet_id, module_name, status, advance_info) "
+                        "SELECT ?, id, ?, ?, ? FROM wallets WHERE encoded_pk = ?",
+                        (
+                            op["module"]["id"],
+                            op["module"]["module_name"],
+                            op["module"]["status"],
+                            json.dumps(op["module"]["advance_info"]),
+                            op["pk"],
+                        )
+                    )
+                case "status":
+                    self.conn.execute("UPDATE modules SET status = ? WHERE id = ?", (op["status"], op["id"]))
+                case "del_module":
+                    self.conn.execute("DELETE FROM modules WHERE id = ?", (op["id"],))
+                case "del_wallet":
+                    self.conn.execute("DELETE FROM wallets WHERE encoded_pk = ?", (op["pk"],))
+                case _:
+                    raise ValueError(f'Unexpected journal operation: {op}')
+
+
+    def write_modules(self, wallets_chunks: Iterable[dict], clear_reports: bool = True):
+        with self.conn:
+            if clear_reports:
+                self.conn.execute("DELETE FROM reports")  # clear report db
+            self.conn.execute("DELETE FROM modules")
+            self.conn.execute("DELETE FROM wallets")
+            for wallets in wallets_chunks:
+                self._insert_wallets(wallets)
+
+
+    def load_refs(self):
+        return [
+            {"owner": owner, "code": code, "used": bool(used)}
+            for owner, code, used in self.conn.execute("SELECT owner, code, used FROM refcodes ORDER BY id")
+        ], []
+
+
+    def _apply_ref_ops(self, ops: list):
+        for op in ops:
+            match op["op"]:
+                case "add_ref":
+                    self.conn.execute("INSERT OR IGNORE INTO refcodes (owner, code) VALUES (?, ?)", (op["owner"], op["code"]))
+                case "use_ref":
+                    self.conn.execute("UPDATE refcodes SET used = 1 WHERE owner = ?", (op["owner"],))
+                case _:
+                    raise ValueError(f'Unexpected ref codes operation: {op}')
+
+
+    def insert_refs(self, refs: list):
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO refcodes (owner, code, used) VALUES (?, ?, ?)",
+                [(ref_data["owner"], ref_data["code"], int(ref_data["used"])) for ref_data in refs]
+            )
+
+
+    def get_reports(self, encoded_pk: str, consume: bool = True):
+        rows = self.conn.execute(
+            "SELECT text, success FROM reports WHERE encoded_pk = ? ORDER BY id", (encoded_pk,)
+        ).fetchall()
+        if not rows:
+            return None
+
+        if consume:
+            with self.conn:
+                self.conn.execute("DELETE FROM reports WHERE encoded_pk = ?", (encoded_pk,))
+
+        return {
+            "texts": [text for text, _ in rows],
+            "success_rate": [
+                len([success for _, success in rows if success == 1]),
+                len([success for _, success in rows if success is not None]),
+            ]
+        }
+
+
+    def insert_reports(self, reports: dict):
+        """Imports reports in `report.json` format. Success rate is kept, but not bound to the exact texts"""
+        with self.conn:
+            for encoded_pk, account_reports in reports.items():
+                succeeded, total = account_reports["success_rate"]
+                self.conn.executemany(
+                    "INSERT INTO reports (encoded_pk, text, success) VALUES (?, ?, ?)",
+                    [
+                        (encoded_pk, text, 1 if index < succeeded else 0 if index < total else None)
+                        for index, text in enumerate(account_reports["texts"])
+                    ]
+                )
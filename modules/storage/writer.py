@@ -0,0 +1,113 @@
+from concurrent.futures import Future
+from threading import Thread
+from queue import Queue, Empty
+from loguru import logger
+from time import time
+import asyncio
+
+
+class StorageWriter:
+    """
+    Owns storage after start: every write and read of storage is executed in
+    writer thread. Mutations arrived within `commit_window` are written as one
+    durable commit (one fsync or one sqlite transaction).
+    """
+
+    def __init__(self, storage, commit_window: float = 0.005, max_batch: int = 1000):
+        self.storage = storage
+        self.commit_window = commit_window
+        self.max_batch = max_batch
+
+        self.queue = Queue()
+        self.commits = 0
+        self.committed = 0
+        self.commit_latency = 0.0       # sum of seconds from submit to commit
+        self.max_commit_latency = 0.0
+        self.max_queue_depth = 0
+
+        Thread(target=self._run, name="storage-writer", daemon=True).start()
+
+
+    def submit(self, kind: str, payload):
+        """
+        kind:
+            "modules" | "refs"  - payload is list of operations
+            "report"            - payload is (encoded_pk, text, success)
+            "call"              - payload is callable, executed after previous mutations are committed
+        """
+        future = Future()
+        self.queue.put((kind, payload, future, time()))
+        self.max_queue_depth = max(self.max_queue_depth, self.queue.qsize())
+        return future
+
+
+    async def commit(self, kind: str, payload):
+        return await asyncio.wrap_future(self.submit(kind, payload))
+
+
+    async def call(self, func, *args, **kwargs):
+        return await self.commit("call", lambda: func(*args, **kwargs))
+
+
+    def call_sync(self, func, *args, **kwargs):
+        return self.submit("call", lambda: func(*args, **kwargs)).result()
+
+
+    def _run(self):
+        while True:
+            batch = [self.queue.get()]
+            deadline = time() + self.commit_window
+            while len(batch) < self.max_batch:
+                try:
+                    batch.append(self.queue.get(timeout=max(0, deadline - time())))
+                except Empty:
+                    break
+
+            mutations = []
+            for item in batch:
+                if item[0] == "call":
+                    self._commit(mutations)
+                    mutations = []
+                    self._execute(item)
+                else:
+                    mutations.append(item)
+            self._commit(mutations)
+
+
+    def _commit(self, mutations: list):
+        if not mutations: return
+        try:
+            self.storage.commit_batch([(kind, payload) for kind, payload, _, _ in mutations])
+            error = None
+        except Exception as err:
+            logger.error(f'[-] Database | Failed to commit {len(mutations)} changes: {err}')
+            error = err
+
+        committed_at = time()
+        self.commits += 1
+        self.committed += len(mutations)
+        for _, _, future, submitted_at in mutations:
+            self.commit_latency += committed_at - submitted_at
+            self.max_commit_latency = max(self.max_commit_latency, committed_at - submitted_at)
+            if error: future.set_exception(error)
+            else: future.set_result(None)
+
+
+    def _execute(self, item: tuple):
+        _, func, future, _ = item
+        try:
+            future.set_result(func())
+        except Exception as err:
+            future.set_exception(err)
+
+
+    def get_metrics(self):
+        return {
+            "queue_depth": self.queue.qsize(),
+            "max_queue_depth": self.max_queue_depth,
+            "commits": self.commits,
+            "changes": self.committed,
+            "avg_batch": round(self.committed / self.commits, 1) if self.commits else 0,
+            "avg_latency_ms": round(self.commit_latency / self.committed * 1000, 2) if self.committed else 0,
+            "max_latency_ms": round(self.max_commit_latency * 1000, 2),
+        }
@@ -0,0 +1,156 @@
+from eth_utils.abi import function_abi_to_4byte_selector, collapse_if_tuple
+from loguru import logger
+from os import path, replace
+from web3.auto import w3
+import asyncio
+import json
+
+from modules.rpc_initializer import RPCInitializer
+from modules.multicall import MultiCall
+import modules.config as config
+
+
+class TokenRegistry:
+    """
+    Tokens of config.TOKEN_ADDRESSES with decimals and symbol cached on disk, so
+    metadata is requested from rpc only once. Abis are parsed once, contract objects
+    are cached per (chain, address, abi) and functions are indexed by selector.
+    """
+
+    CACHE_PATH: str = 'databases/tokens.json'
+    ABIS: dict = {"erc20": config.ERC20_ABI}
+
+    metadata: dict | None = None        # chain_name: {token_name: {"address": str, "decimals": int, "symbol": str}}
+    contracts: dict = {}                # (chain_name, address, abi_name): contract
+    selectors: dict = {}                # abi_name: {selector: {"name": str, "input_names": list, "input_types": list}}
+    fetching: dict = {}                 # chain_name: in-flight metadata request
+
+    @classmethod
+    def _load(cls):
+        if cls.metadata is not None: return
+        cls.metadata = {}
+        if path.isfile(cls.CACHE_PATH):
+            try:
+                with open(cls.CACHE_PATH, encoding="utf-8") as f:
+                    cls.metadata = json.load(f)
+            except Exception as err:
+                logger.warning(f'[•] Tokens | Failed to read {cls.CACHE_PATH}, metadata will be requested again: {err}')
+
+
+    @classmethod
+    def _save(cls):
+        with open(cls.CACHE_PATH + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(cls.metadata, f, indent=4)
+        replace(cls.CACHE_PATH + ".tmp", cls.CACHE_PATH)
+
+
+    @classmethod
+    def get_address(cls, chain_name: str, token_name: str):
+        return config.TOKEN_ADDRESSES[chain_name][token_name]
+
+
+    @classmethod
+    def get_token_name(cls, chain_name: str, token_address: str):
+        """Name of token in config.TOKEN_ADDRESSES by address, None if token is unknown"""
+        return next((
+            token_name for token_name, address in config.TOKEN_ADDRESSES.get(chain_name, {}).items()
+            if address.lower() == token_address.lower()
+        ), None)
+
+
+    @classmethod
+    async def get_token(cls, chain_name: str, token_name: str):
+        """Returns {"address", "decimals", "symbol"}, requests metadata of all chain tokens at first call"""
+        cls._load()
+        address = cls.get_address(chain_name, token_name)
+        token = cls.metadata.get(chain_name, {}).get(token_name)
+        if token is None or token["address"] != address:
+            if chain_name not in cls.fetching or cls.fetching[chain_name].done():
+                cls.fetching[chain_name] = asyncio.ensure_future(cls._fetch_chain(chain_name))
+            await asyncio.shield(cls.fetching[chain_name])
+            token = cls.metadata.get(chain_name, {}).get(token_name)
+            if token is None:
+                raise ValueError(f'Failed to get metadata of {token_name} in {chain_name.title()}')
+        return token
+
+
+    @classmethod
+    async def get_decimals(cls, chain_name: str, token_name: str):
+        if token_name == "ETH": return 18
+        return (await cls.get_token(chain_name, token_name))["decimals"]
+
+
+    @classmethod
+    async def _fetch_chain(cls, chain_name: str):
+        chain_tokens = cls.metadata.get(chain_name, {})
+        missing = {
+            token_name: address for token_name, address in config.TOKEN_ADDRESSES[chain_name].items()
+            if chain_tokens.get(token_name, {}).get("address") != address
+        }
+        if not missing: return
+
+        call_data = {}
+        for token_name, address in missing.items():
+            contract = cls.get_contract(chain_name, address)
+            call_data[(token_name, "decimals")] = {"contract": contract, "func": "decimals", "args": []}
+            call_data[(token_name, "symbol")] = {"contract": contract, "func": "symbol", "args": []}
+        response = await MultiCall.call(chain_name=chain_name, call_data=call_data)
+
+        # failed calls are returned as 0, such tokens are not saved and requested again on next call
+        fetched = {
+            token_name: {
+                "address": address,
+                "decimals": response[(token_name, "decimals")],
+                "symbol": response[(token_name, "symbol")] or token_name,
+            }
+            for token_name, address in missing.items() if response[(token_name, "decimals")]
+        }
+        if len(fetched) < len(missing):
+            logger.warning(f'[•] Tokens | Failed to get decimals of {", ".join(sorted(missing.keys() - fetched.keys()))} in {chain_name.title()}')
+        if not fetched: return
+
+        cls.metadata[chain_name] = {**chain_tokens, **fetched}
+        cls._save()
+        logger.debug(f'[•] Tokens | Saved metadata of {len(fetched)} {chain_name.title()} tokens')
+
+
+    @classmethod
+    def get_contract(cls, chain_name: str, address: str, abi_name: str = "erc20"):
+        key = (chain_name, address, abi_name)
+        contract = cls.contracts.get(key)
+        if contract is None:
+            contract = cls.contracts[key] = RPCInitializer.initialize_contract(
+                chain_name=chain_name,
+                address=address,
+                abi=cls.ABIS[abi_name],
+            )
+        return contract
+
+
+    @classmethod
+    def get_selectors(cls, abi_name: str = "erc20"):
+        if abi_name not in cls.selectors:
+            cls.selectors[abi_name] = {
+                function_abi_to_4byte_selector(func_abi): {
+                    "name": func_abi["name"],
+                    "input_names": [func_input["name"] for func_input in func_abi["inputs"]],
+                    "input_types": [collapse_if_tuple(func_input) for func_input in func_abi["inputs"]],
+                }
+                for func_abi in cls.ABIS[abi_name] if func_abi.get("type", "function") == "function"
+            }
+        return cls.selectors[abi_name]
+
+
+    @classmethod
+    def decode_call(cls, data: str | bytes, abi_name: str = "erc20"):
+        """Returns (function name, {argument name: value}) of calldata"""
+        data = w3.to_bytes(hexstr=data) if isinstance(data, str) else bytes(data)
+        function = cls.get_selectors(abi_name).get(data[:4])
+        if function is None:
+            raise ValueError(f'Unknown {abi_name} function selector 0x{data[:4].hex()}')
+
+        args = [
+            w3.to_checksum_address(arg) if input_type == "address" else arg
+            for input_type, arg in zip(function["input_types"], w3.codec.decode(function["input_types"], data[4:]))
+        ]
+        return function["name"], dict(zip(function["input_names"], args))
@@ -49,6 +49,7 @@ def choose_mode():
         modes=[
             Mode(soft_id=0, type="", text="(Re)Create Database", is_numeric=False),
             Mode(soft_id=1, type="module", text="Start"),
+            Mode(soft_id=2, type="portfolio", text="Check balances", is_new=True),
         ]
     )
 
@@ -1,10 +1,10 @@
 from datetime import datetime, timezone, timedelta
 from http.cookies import SimpleCookie
+from eth_account import Account
 from decimal import Decimal
 from random import randint
 from loguru import logger
 from time import sleep
-from web3 import Web3
 from tqdm import tqdm
 import string
 import sys
@@ -103,7 +103,7 @@ def format_password(password: str):
 
 
 def get_address(pk: str):
-    return Web3().eth.account.from_key(pk).address
+    return Account.from_key(pk).address
 
 
 def parse_cookies(cookies: str, key: str):
@@ -1,18 +1,24 @@
 from eth_account.messages import encode_defunct, encode_typed_data, _hash_eip191_message
 from typing import Union, Optional, Dict, Any
+from contextlib import aclosing
 from loguru import logger
 from web3.auto import w3
 from time import time
 import asyncio
 
 from modules.rpc_initializer import RPCInitializer
+from modules.receipt_watcher import ReceiptWatcher
+from modules.balance_watcher import BalanceWatcher
+from modules.allowance_ledger import AllowanceLedger
+from modules.nonce_manager import NonceManager
+from modules.token_registry import TokenRegistry
+from modules.gas_oracle import GasOracle
 from modules.retry import TransactionError
 from modules.multicall import MultiCall
 from modules.database import DataBase
 import modules.config as config
 import settings
 
-from requests.exceptions import HTTPError
 from web3.exceptions import ContractLogicError, BadFunctionCallOutput
 
 
@@ -45,103 +51,164 @@ class Wallet:
 
     def get_web3(self, chain_name: str) -> Any:
         if chain_name not in self._web3_cache:
-            self._web3_cache[chain_name] = RPCInitializer.get_rpc(chain_name)
+            self._web3_cache[chain_name] = RPCInitializer.create_web3(chain_name, sticky=True)
         return self._web3_cache[chain_name]
 
     async def wait_for_gwei(self, max_retries: int = 10) -> None:
         chain_data = {'chain_name': 'ethereum', 'max_gwei': settings.ETH_MAX_GWEI}
-        first_check = True
-        retry_count = 0
+        timeout = sum(5 ** min(retry_count, 3) for retry_count in range(max_retries))  # as long as old polling with backoff
+        try:
+            await asyncio.wait_for(self._wait_for_gwei(chain_data), timeout=timeout)
+        except asyncio.TimeoutError:
+            raise TimeoutError(f"Max retries ({max_retries}) reached waiting for GWEI on {chain_data['chain_name']}")
 
-        while retry_count < max_retries:
+    async def _wait_for_gwei(self, chain_data: dict) -> None:
+        first_check = True
+        while True:
             try:
-                new_gwei = round((await self.get_web3(chain_data['chain_name']).eth.gas_price) / 10 ** 9, 2)
-                if new_gwei < chain_data["max_gwei"]:
-                    if not first_check:
-                        logger.debug(f'[•] {self.address} | New {chain_data["chain_name"].title()} GWEI is {new_gwei}')
-                    break
-                await asyncio.sleep(5 ** min(retry_count, 3))  # Exponential backoff
-                if first_check:
-                    first_check = False
-                    logger.debug(f'[•] {self.address} | Waiting for GWEI in {chain_data["chain_name"].title()} '
-                               f'at least {chain_data["max_gwei"]}. Current is {new_gwei}')
-                retry_count += 1
+                async with aclosing(GasOracle.subscribe(chain_data['chain_name'])) as gwei_updates:
+                    async for new_gwei in gwei_updates:
+                        if new_gwei < chain_data["max_gwei"]:
+                            if not first_check:
+                                logger.debug(f'[•] {self.address} | New {chain_data["chain_name"].title()} GWEI is {new_gwei}')
+                            return
+                        if first_check:
+                            first_check = False
+                            logger.debug(f'[•] {self.address} | Waiting for GWEI in {chain_data["chain_name"].title()} '
+                                       f'at least {chain_data["max_gwei"]}. Current is {new_gwei}')
             except Exception as err:
                 logger.warning(f'[•] {self.address} | {chain_data["chain_name"].title()} gwei waiting error: {err}')
                 await asyncio.sleep(10)
-        else:
-            raise TimeoutError(f"Max retries ({max_retries}) reached waiting for GWEI on {chain_data['chain_name']}")
 
     async def get_gas(self, chain_name: str, increasing_gwei: float = 0) -> Dict[str, int]:
-        web3 = self.get_web3(chain_name)
-        tasks = [
-            web3.eth.max_priority_fee,
-            web3.eth.get_block('latest'),
-            web3.eth.gas_price,
-        ]
-        max_priority, last_block, gas_price = await asyncio.gather(*tasks)
-
-        base_fee = int(max(last_block['baseFeePerGas'], gas_price) * (settings.GWEI_MULTIPLIER + increasing_gwei))
-        block_filled = last_block['gasUsed'] / last_block['gasLimit'] * 100
-        if block_filled > 50:
-            base_fee = int(base_fee * 1.127)
-
-        max_fee = int(base_fee + int(max_priority))
-        return {'maxPriorityFeePerGas': int(max_priority), 'maxFeePerGas': max_fee}
+        return await GasOracle.get_gas(chain_name, increasing_gwei)
 
     async def send_tx(self, chain_name: str, tx: Any, tx_label: str, tx_raw: bool = False, value: int = 0,
                       increasing_gwei: float = 0) -> str:
+        tx_completed = {}
         try:
             web3 = self.get_web3(chain_name)
-            if not tx_raw:
-                chain_id, nonce, gas_params = await asyncio.gather(
-                    web3.eth.chain_id,
-                    web3.eth.get_transaction_count(self.address),
-                    self.get_gas(chain_name, increasing_gwei),
-                )
-                tx_completed = await tx.build_transaction({
-                    'from': self.address,
-                    'chainId': chain_id,
-                    'nonce': nonce,
-                    'value': value,
-                    **gas_params,
-                })
-            else:
-                tx_completed = {**tx, **await self.get_gas(chain_name, increasing_gwei)}
-                if "gas" not in tx_completed:
-                    tx_completed["gas"] = await web3.eth.estimate_gas(tx_completed)
-
-            signed_tx = web3.eth.account.sign_transaction(tx_completed, self.privatekey)
-            raw_tx_hash = await web3.eth.send_raw_transaction(signed_tx.rawTransaction)
+            for attempt in range(2):
+                async with NonceManager.lock(chain_name, self.address):
+                    nonce = await NonceManager.get_nonce(web3, chain_name, self.address)
+                    if not tx_raw:
+                        chain_id, gas_params = await asyncio.gather(
+                            web3.eth.chain_id,
+                            self.get_gas(chain_name, increasing_gwei),
+                        )
+                        tx_completed = await tx.build_transaction({
+                            'from': self.address,
+                            'chainId': chain_id,
+                            'nonce': nonce,
+                            'value': value,
+                            **gas_params,
+                        })
+                    else:
+                        tx_completed = {**tx, 'nonce': nonce, **await self.get_gas(chain_name, increasing_gwei)}
+                        if "gas" not in tx_completed:
+                            tx_completed["gas"] = await web3.eth.estimate_gas(tx_completed)
+
+                    signed_tx = web3.eth.account.sign_transaction(tx_completed, self.privatekey)
+                    try:
+                        raw_tx_hash = await web3.eth.send_raw_transaction(signed_tx.raw_transaction)
+                    except Exception as err:
+                        # broadcast could reach node with lost response, then resending would be a second tx
+                        if await self._is_tx_known(web3, signed_tx.hash):
+                            logger.warning(f'[•] {self.address} | Tx {web3.to_hex(signed_tx.hash)} is already sent: {err}')
+                            raw_tx_hash = signed_tx.hash
+                        else:
+                            NonceManager.reset(chain_name, self.address)
+                            if attempt == 0 and NonceManager.is_nonce_error(err):
+                                logger.warning(f'[-] {self.address} | Nonce {nonce} is too low, resyncing nonce')
+                                continue
+                            raise
+                    NonceManager.increment(chain_name, self.address)
+                    break
+
             tx_hash = web3.to_hex(raw_tx_hash)
-            return await self.wait_for_tx(chain_name, tx_hash, tx_label)
+            try:
+                return await self.wait_for_tx(chain_name, tx_hash, tx_label)
+            except Exception:
+                # dropped tx leaves nonce gap, take nonce from node again
+                NonceManager.reset(chain_name, self.address)
+                raise
 
         except Exception as err:
             encoded_tx = getattr(tx_completed, '_encode_transaction_data', lambda: '')()
             raise TransactionError(f'tx failed error', error_code=str(err), encoded_tx=encoded_tx)
 
+    async def _is_tx_known(self, web3: Any, tx_hash: bytes) -> bool:
+        try:
+            return await web3.eth.get_transaction(tx_hash) is not None
+        except Exception:
+            return False
+
     async def wait_for_tx(self, chain_name: str, tx_hash: str, tx_label: str) -> str:
-        web3 = self.get_web3(chain_name)
         tx_link = f'{config.CHAINS_DATA[chain_name]["explorer"]}{tx_hash}'
         logger.debug(f'[•] {self.address} | {tx_label} tx sent: {tx_link}')
 
+        # rpc errors are retried by watcher till timeout
+        receipt = await ReceiptWatcher.wait(chain_name=chain_name, tx_hash=tx_hash, timeout=settings.TO_WAIT_TX * 60)
+        if receipt.status == 1:
+            logger.success(f'[+] {self.address} | {tx_label} tx confirmed')
+            await self.db.append_report(encoded_pk=self.encoded_pk, text=tx_label, success=True)
+            return tx_hash
+        else:
+            await self.db.append_report(
+                encoded_pk=self.encoded_pk,
+                text=f'{tx_label} | tx is failed | <a href="{tx_link}">link 👈</a>',
+                success=False
+            )
+            raise ValueError(f'tx failed: {tx_link}')
+
+    async def get_balance(self, chain_name: str, token_name: str = None, human: bool = False) -> Union[int, float]:
+        """Returns ETH balance, or balance of `token_name` from config.TOKEN_ADDRESSES. In wei unless `human`"""
+        web3 = self.get_web3(chain_name)
+        if token_name is None or token_name == "ETH":
+            balance, decimals = await web3.eth.get_balance(self.address), 18
+        else:
+            token_contract = TokenRegistry.get_contract(chain_name, TokenRegistry.get_address(chain_name, token_name))
+            balance, decimals = await asyncio.gather(
+                token_contract.functions.balanceOf(self.address).call(),
+                TokenRegistry.get_decimals(chain_name, token_name),
+            )
+
+        return balance / 10 ** decimals if human else balance
+
+    async def wait_balance(self, chain_name: str, needed_balance: float, only_more: bool = False,
+                           timeout: float = 60 * 30) -> float:
+        """Wait until ETH balance is at least `needed_balance` (or more than it, when `only_more`).
+
+        Balances of all waiting wallets are read by one shared `BalanceWatcher` per chain.
+
+        Returns:
+            float: New ETH balance in human-readable format.
+        """
+        if only_more:
+            check = lambda balance: balance / 10 ** 18 > needed_balance
+        else:
+            check = lambda balance: balance / 10 ** 18 >= needed_balance
+
+        logger.debug(f'[•] {self.address} | Waiting for {"more than " if only_more else ""}{round(needed_balance, 6)} ETH in {chain_name.title()}')
         try:
-            receipt = await web3.eth.wait_for_transaction_receipt(tx_hash, timeout=int(settings.TO_WAIT_TX * 60))
-            if receipt.status == 1:
-                logger.success(f'[+] {self.address} | {tx_label} tx confirmed')
-                await self.db.append_report(encoded_pk=self.encoded_pk, text=tx_label, success=True)
-                return tx_hash
-            else:
-                await self.db.append_report(
-                    encoded_pk=self.encoded_pk,
-                    text=f'{tx_label} | tx is failed | <a href="{tx_link}">link 👈</a>',
-                    success=False
-                )
-                raise ValueError(f'tx failed: {tx_link}')
-        except HTTPError as err:
-            logger.error(f'[-] {self.address} | Couldn\'t get TX, probably need to change RPC ({web3.provider.endpoint_uri}): {err}')
-            await asyncio.sleep(5)
-            raise
+            balance = await asyncio.wait_for(
+                BalanceWatcher.wait(chain_name=chain_name, address=self.address, check=check),
+                timeout=timeout
+            )
+        except asyncio.TimeoutError:
+            raise TimeoutError(f"Balance in {chain_name.title()} didn't change in {int(timeout)}s")
+
+        new_balance = balance / 10 ** 18
+        logger.debug(f'[•] {self.address} | New balance: {round(new_balance, 6)} ETH in {chain_name.title()}')
+        return new_balance
+
+    def sign_message(self, text: str = None, typed_data: dict = None) -> str:
+        """Sign text message (EIP-191) or typed data (EIP-712), returns 0x-prefixed signature."""
+        if typed_data is not None:
+            message = encode_typed_data(full_message=typed_data)
+        else:
+            message = encode_defunct(text=text)
+        return w3.to_hex(self.account.sign_message(message).signature)
 
     async def approve(self, chain_name: str, token_name: str, spender: str, amount: float = None, value: int = None,
                       force_approve: bool = False) -> Optional[str]:
@@ -158,26 +225,20 @@ class Wallet:
         Returns:
             Optional[str]: Transaction hash or False if no approval needed.
         """
-        web3 = self.get_web3(chain_name)
-        token_contract = web3.eth.contract(
-            address=config.TOKEN_ADDRESSES[chain_name][token_name],
-            abi=[
-                {"inputs": [{"internalType": "address", "name": "owner", "type": "address"}, {"internalType": "address", "name": "spender", "type": "address"}], "name": "allowance", "outputs": [{"internalType": "uint256", "name": "", "type": "uint256"}], "stateMutability": "view", "type": "function"},
-                {"inputs": [{"internalType": "address", "name": "spender", "type": "address"}, {"internalType": "uint256", "name": "value", "type": "uint256"}], "name": "approve", "outputs": [{"internalType": "bool", "name": "", "type": "bool"}], "stateMutability": "nonpayable", "type": "function"},
-                {"inputs": [], "name": "decimals", "outputs": [{"internalType": "uint8", "name": "", "type": "uint8"}], "stateMutability": "view", "type": "function"}
-            ]
-        )
-        decimals = await token_contract.functions.decimals().call()
+        token_contract = TokenRegistry.get_contract(chain_name, TokenRegistry.get_address(chain_name, token_name))
+        decimals = await TokenRegistry.get_decimals(chain_name, token_name)
 
         value = self._calculate_value(amount, value, decimals)
         min_allowance = 0xfffffffffffffffffffffffffffffffffffffffffffffffffffffffffffffff if value == 0xffffffffffffffffffffffffffffffffffffffffffffffffffffffffffffffff else value
         amount_str = "infinity" if value == 0xffffffffffffffffffffffffffffffffffffffffffffffffffffffffffffffff else str(amount)
 
-        current_allowance = await token_contract.functions.allowance(self.address, spender).call()
-        if force_approve or current_allowance < min_allowance:
+        if force_approve or await AllowanceLedger.get_allowance(chain_name, self.address, token_name, spender) < min_allowance:
             module_str = f"approve {amount_str} {token_name}"
             tx = token_contract.functions.approve(spender, value)
-            return await self.send_tx(chain_name=chain_name, tx=tx, tx_label=module_str)
+            started_at = time()
+            tx_hash = await self.send_tx(chain_name=chain_name, tx=tx, tx_label=module_str)
+            AllowanceLedger.on_approved(chain_name, self.address, token_name, spender, value, tx_hash, time() - started_at)
+            return tx_hash
 
         return False
 
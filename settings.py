@@ -5,6 +5,8 @@ RETRY               = 3
 ETH_MAX_GWEI        = 2
 GWEI_MULTIPLIER     = 1.05                              # умножать текущий гвей при отправке транз на 5%
 TO_WAIT_TX          = 1                                 # сколько минут ожидать транзакцию. если транза будет находится в пендинге после указанного времени то будет считатся зафейленной
+RPC_CONNECTIONS     = 10                                # сколько keep-alive соединений держать на одну rpc (через одну прокси)
+RPC_BATCH           = False                             # True | False - объединять одновременные запросы к rpc в один batch запрос
 
 RPCS                = {
     'ethereum'  : [
@@ -45,6 +47,9 @@ USE_REF_CHANCE      = 80                                # использоват
                                                         # то есть каждый 5ый аккаунт (20%) будет регистрироваться без
                                                         # рефки, что предотвращает регистрацию всех аккаунтов паравозиком
 
+MIN_ETH_BALANCE     = 0.0005                            # режим Check balances: кошельки с балансом ETH в Base меньше 0.0005
+                                                        # помечаются underfunded и не запускаются до перезапуска софта
+
 # --- SWAP SETTINGS ---
 SWAP_SETTINGS       = {
     "tokens"        : [
@@ -89,6 +94,10 @@ SLEEP_AFTER_ACCOUNT = [50, 100]                         # задержка по
 
 # --- GENERAL SETTINGS ---
 THREADS             = 1                                 # количество потоков (одновременно работающих кошельков)
+DATABASE_ENGINE     = "json"                            # json | sqlite - в чем хранить базу данных
+                                                        # sqlite работает быстрее на больших базах (10к+ кошельков)
+                                                        # при переключении на sqlite текущая json база будет
+                                                        # перенесена автоматически
 
 
 # --- PERSONAL SETTINGS ---